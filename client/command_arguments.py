@@ -252,6 +252,7 @@ class StatisticsArguments:
     log_results: bool = False
     aggregate: bool = False
     print_summary: bool = False
+    use_cache: bool = False
 
 
 @dataclass(frozen=True)
@@ -128,8 +128,7 @@ def _location_to_covered_lines(location: coverage_data.Location) -> Set[int]:
 
 
 def to_absolute_path(given: str, working_directory: Path) -> Path:
-    path = Path(given)
-    return path if path.is_absolute() else working_directory / path
+    return Path(given) if os.path.isabs(given) else working_directory / given
 
 
 def find_root_path(local_root: Optional[Path], working_directory: Path) -> Path:
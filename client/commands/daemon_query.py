@@ -21,12 +21,18 @@ from __future__ import annotations
 
 import json
 import logging
+from json.encoder import encode_basestring_ascii
 from pathlib import Path
 
 from typing import List, Optional, Type, TypeVar, Union
 
 import dataclasses_json
 
+try:
+    import orjson  # @manual
+except ImportError:
+    orjson = None
+
 from .. import dataclasses_json_extensions as json_mixins, error
 
 from ..language_server import daemon_connection
@@ -41,9 +47,22 @@ QueryResponseType = TypeVar(
 LOG: logging.Logger = logging.getLogger(__name__)
 
 
+def _encode_query_request(query_text: str) -> bytes:
+    """
+    Serialize `["Query", query_text]`. The request always has this shape, so
+    when orjson is unavailable we only escape the query string instead of
+    going through the generic `json.dumps` machinery.
+    """
+    if orjson is not None:
+        return orjson.dumps(["Query", query_text])
+    return b'["Query",' + encode_basestring_ascii(query_text).encode("ascii") + b"]"
+
+
 def execute_query(socket_path: Path, query_text: str) -> Response:
-    raw_request = json.dumps(["Query", query_text])
-    raw_response = daemon_connection.send_raw_request(socket_path, raw_request)
+    raw_request = _encode_query_request(query_text)
+    raw_response = daemon_connection.default_connection_pool.send_raw_request_bytes(
+        socket_path, raw_request
+    )
     return Response.parse(raw_response)
 
 
@@ -16,39 +16,52 @@ of the response for any given query.
 
 from __future__ import annotations
 
-import dataclasses
 import json
+from typing import NamedTuple, Union
+
+try:
+    import orjson  # @manual
+except ImportError:
+    orjson = None
 
 
 class InvalidQueryResponse(Exception):
     pass
 
 
-@dataclasses.dataclass(frozen=True)
-class Response:
+class Response(NamedTuple):
+    # A `NamedTuple` rather than a frozen dataclass: one of these is created for
+    # every query, and tuple construction and field access are cheaper than
+    # going through a dataclass `__init__`.
     payload: object
 
     @staticmethod
     def from_json(
         response_json: object,
     ) -> Response:
-        if (
-            isinstance(response_json, list)
-            and len(response_json) > 1
-            and response_json[0] == "Query"
-        ):
-            return Response(response_json[1])
-        else:
-            raise InvalidQueryResponse(
-                f"Unexpected JSON response from server: {response_json}"
-            )
+        # Responses always come as a `["Query", payload]` pair. The list check
+        # is kept so that e.g. a two-key dict is not unpacked by accident.
+        if isinstance(response_json, list):
+            try:
+                tag, payload = response_json
+            except ValueError:
+                pass
+            else:
+                if tag == "Query":
+                    return Response(payload)
+        raise InvalidQueryResponse(
+            f"Unexpected JSON response from server: {response_json}"
+        )
 
     @staticmethod
     def parse(
-        response_text: str,
+        response_text: Union[str, bytes],
     ) -> Response:
         try:
-            response_json = json.loads(response_text)
+            if orjson is not None:
+                response_json = orjson.loads(response_text)
+            else:
+                response_json = json.loads(response_text)
             return Response.from_json(response_json)
         except json.JSONDecodeError as decode_error:
             message = f"Cannot parse response as JSON: {decode_error}"
@@ -100,11 +100,9 @@ class ModuleData(json_mixins.SnakeCaseAndExcludeJsonMixin):
         strict_by_default: bool,
         ignored: bool,
     ) -> ModuleData:
-        mode = coverage_data.collect_mode(
+        mode, functions, suppressions = coverage_data.collect_all(
             module, strict_by_default, path.relative_to_root, ignored
         )
-        suppressions = coverage_data.collect_suppressions(module)
-        functions = coverage_data.collect_functions(module)
         return ModuleData(
             mode=mode,
             suppressions=suppressions,
@@ -22,12 +22,20 @@ report` and migrate use cases.
 """
 
 
+from __future__ import annotations
+
 import dataclasses
+import importlib.metadata
+import itertools
 import json
 import logging
+import multiprocessing
+import os
+import pickle
 import re
+import sqlite3
 from pathlib import Path
-from typing import Dict, Iterable, List, Mapping, Optional
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional, Set, Tuple
 
 import libcst
 from libcst.metadata import CodePosition, CodeRange
@@ -38,6 +46,8 @@ from . import commands
 
 LOG: logging.Logger = logging.getLogger(__name__)
 
+STATISTICS_CACHE_NAME: str = "statistics_cache.sqlite3"
+
 
 def location_to_code_range(location: coverage_data.Location) -> CodeRange:
     """
@@ -64,12 +74,17 @@ class ModuleSuppressionData:
 
 
 class SuppressionCountCollector(coverage_data.VisitorWithPositionData):
-    def __init__(self, regex: str) -> None:
+    def __init__(self, regex: str, marker: str) -> None:
         self.no_code: List[int] = []
         self.codes: Dict[int, List[int]] = {}
         self.regex: re.Pattern[str] = re.compile(regex)
+        # A substring every match of `regex` contains, used to skip the regex
+        # engine for the vast majority of comments.
+        self.marker: str = marker
 
     def error_codes(self, line: str) -> Optional[List[coverage_data.ErrorCode]]:
+        if self.marker not in line:
+            return None
         match = self.regex.match(line)
         if match is None:
             # No suppression on line
@@ -100,27 +115,30 @@ class SuppressionCountCollector(coverage_data.VisitorWithPositionData):
             else:
                 self.codes[code] = [suppression_line]
 
+    def build(self) -> ModuleSuppressionData:
+        return ModuleSuppressionData(code=self.codes, no_code=self.no_code)
+
     def collect(
         self,
         module: libcst.MetadataWrapper,
     ) -> ModuleSuppressionData:
         module.visit(self)
-        return ModuleSuppressionData(code=self.codes, no_code=self.no_code)
+        return self.build()
 
 
 class FixmeCountCollector(SuppressionCountCollector):
     def __init__(self) -> None:
-        super().__init__(r".*# *pyre-fixme(\[(\d* *,? *)*\])?")
+        super().__init__(r".*# *pyre-fixme(\[(\d* *,? *)*\])?", marker="pyre-fixme")
 
 
 class IgnoreCountCollector(SuppressionCountCollector):
     def __init__(self) -> None:
-        super().__init__(r".*# *pyre-ignore(\[(\d* *,? *)*\])?")
+        super().__init__(r".*# *pyre-ignore(\[(\d* *,? *)*\])?", marker="pyre-ignore")
 
 
 class TypeIgnoreCountCollector(SuppressionCountCollector):
     def __init__(self) -> None:
-        super().__init__(r".*# *type: ignore")
+        super().__init__(r".*# *type: ignore", marker="type: ignore")
 
 
 @dataclasses.dataclass(frozen=True)
@@ -165,6 +183,9 @@ class AnnotationCountCollector(coverage_data.AnnotationCollector):
         module: libcst.MetadataWrapper,
     ) -> ModuleAnnotationData:
         module.visit(self)
+        return self.build()
+
+    def build(self) -> ModuleAnnotationData:
         return ModuleAnnotationData(
             line_count=self.line_count,
             total_functions=[
@@ -234,31 +255,255 @@ class StatisticsData:
     strict: coverage_data.ModuleModeInfo
 
 
-def collect_statistics(
-    sources: Iterable[Path], strict_default: bool
-) -> Dict[str, StatisticsData]:
-    data: Dict[str, StatisticsData] = {}
-    for path in sources:
-        module = coverage_data.module_from_path(path)
-        if module is None:
-            continue
+# Bump this whenever the collectors change what they produce, so that stale
+# entries in existing caches are ignored.
+_CACHE_SCHEMA_VERSION: int = 1
+
+
+def _libcst_version() -> str:
+    try:
+        return importlib.metadata.version("libcst")
+    except importlib.metadata.PackageNotFoundError:
+        return "unknown"
+
+
+class StatisticsCache:
+    """
+    An on-disk cache of per-module statistics, backed by sqlite. Entries are
+    keyed on the module path, its modification time and size, and the strict
+    default, so that re-running statistics on a mostly unchanged project only
+    parses the modules that changed.
+
+    Every process opens its own connection (see `_get_cache`); WAL mode lets
+    the workers of a pool read and write the cache concurrently.
+    """
+
+    def __init__(self, connection: sqlite3.Connection) -> None:
+        self.connection = connection
+        self.version: str = f"{_CACHE_SCHEMA_VERSION}:{_libcst_version()}"
+
+    @staticmethod
+    def open(cache_path: Path) -> Optional[StatisticsCache]:
         try:
-            annotations = AnnotationCountCollector().collect(module)
-            fixmes = FixmeCountCollector().collect(module)
-            ignores = IgnoreCountCollector().collect(module)
-            modes = coverage_data.collect_mode(module, strict_default, path)
-            statistics_data = StatisticsData(
-                annotations,
-                fixmes,
-                ignores,
-                modes,
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(
+                str(cache_path), timeout=30, isolation_level=None
             )
-            data[str(path)] = statistics_data
-        except RecursionError:
-            LOG.warning(f"LibCST encountered recursion error in `{path}`")
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS statistics (
+                    path TEXT PRIMARY KEY,
+                    mtime_ns INTEGER NOT NULL,
+                    size INTEGER NOT NULL,
+                    strict_default INTEGER NOT NULL,
+                    version TEXT NOT NULL,
+                    data BLOB NOT NULL
+                )
+                """
+            )
+        except (OSError, sqlite3.Error) as error:
+            LOG.warning(f"Could not open statistics cache at `{cache_path}`: {error}")
+            return None
+        return StatisticsCache(connection)
+
+    def load(
+        self, path: Path, stat: os.stat_result, strict_default: bool
+    ) -> Optional[StatisticsData]:
+        try:
+            row = self.connection.execute(
+                "SELECT data FROM statistics WHERE path = ? AND mtime_ns = ? "
+                "AND size = ? AND strict_default = ? AND version = ?",
+                (
+                    str(path),
+                    stat.st_mtime_ns,
+                    stat.st_size,
+                    strict_default,
+                    self.version,
+                ),
+            ).fetchone()
+        except sqlite3.Error as error:
+            LOG.debug(f"Could not read statistics cache entry for `{path}`: {error}")
+            return None
+        if row is None:
+            return None
+        try:
+            return pickle.loads(row[0])
+        except Exception as error:
+            # Entries pickled by an older client may refer to classes that have
+            # since been renamed or reshaped; treat them as a miss.
+            LOG.debug(
+                f"Dropping unreadable statistics cache entry for `{path}`: {error}"
+            )
+            self.discard(path)
+            return None
+
+    def discard(self, path: Path) -> None:
+        try:
+            self.connection.execute(
+                "DELETE FROM statistics WHERE path = ?", (str(path),)
+            )
+        except sqlite3.Error as error:
+            LOG.debug(f"Could not drop statistics cache entry for `{path}`: {error}")
+
+    def store(
+        self,
+        path: Path,
+        stat: os.stat_result,
+        strict_default: bool,
+        data: StatisticsData,
+    ) -> None:
+        try:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO statistics VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    str(path),
+                    stat.st_mtime_ns,
+                    stat.st_size,
+                    strict_default,
+                    self.version,
+                    pickle.dumps(data),
+                ),
+            )
+        except sqlite3.Error as error:
+            LOG.debug(f"Could not cache statistics for `{path}`: {error}")
+
+
+# sqlite connections must not be shared across `fork`, hence the pid.
+_caches: Dict[Tuple[int, Path], Optional[StatisticsCache]] = {}
+
+
+def _get_cache(cache_path: Path) -> Optional[StatisticsCache]:
+    key = (os.getpid(), cache_path)
+    if key not in _caches:
+        _caches[key] = StatisticsCache.open(cache_path)
+    return _caches[key]
+
+
+@dataclasses.dataclass(frozen=True)
+class CollectStatisticsArgs:
+    """
+    Multiprocessing requires mapping a function over a list of single
+    arguments, so we have to make a struct in order to parallelize
+    collect_statistics_for_path.
+    """
+
+    path: Path
+    strict_default: bool
+    cache_path: Optional[Path] = None
+
+
+def _collect_statistics_for_module(
+    path: Path,
+    strict_default: bool,
+) -> Optional[StatisticsData]:
+    module = coverage_data.module_from_path(path)
+    if module is None:
+        return None
+    try:
+        annotations = AnnotationCountCollector()
+        fixmes = FixmeCountCollector()
+        ignores = IgnoreCountCollector()
+        modes = coverage_data.ModuleModeCollector(strict_default)
+        module.visit(
+            coverage_data.CompositeVisitor([annotations, fixmes, ignores, modes])
+        )
+        return StatisticsData(
+            annotations.build(),
+            fixmes.build(),
+            ignores.build(),
+            modes.to_module_mode_info(path),
+        )
+    except RecursionError:
+        LOG.warning(f"LibCST encountered recursion error in `{path}`")
+        return None
+
+
+def collect_statistics_for_path(
+    args: CollectStatisticsArgs,
+) -> Optional[StatisticsData]:
+    path = args.path
+    cache = _get_cache(args.cache_path) if args.cache_path is not None else None
+    if cache is None:
+        return _collect_statistics_for_module(path, args.strict_default)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    data = cache.load(path, stat, args.strict_default)
+    if data is None:
+        data = _collect_statistics_for_module(path, args.strict_default)
+        if data is not None:
+            cache.store(path, stat, args.strict_default, data)
     return data
 
 
+def _collect_statistics_for_task(
+    args: CollectStatisticsArgs,
+) -> Tuple[Path, Optional[StatisticsData]]:
+    return args.path, collect_statistics_for_path(args)
+
+
+def _unique_tasks(
+    sources: Iterable[Path],
+    strict_default: bool,
+    cache_path: Optional[Path],
+) -> Iterator[CollectStatisticsArgs]:
+    # The same module may be reached through overlapping source paths; make
+    # sure it is only parsed once.
+    seen: Set[str] = set()
+    for path in sources:
+        key = os.path.normcase(os.path.abspath(path))
+        if key not in seen:
+            seen.add(key)
+            yield CollectStatisticsArgs(
+                path=path, strict_default=strict_default, cache_path=cache_path
+            )
+
+
+def _statistics_by_path(
+    results: Iterable[Tuple[Path, Optional[StatisticsData]]],
+) -> Dict[str, StatisticsData]:
+    return {
+        str(path): statistics_data
+        for path, statistics_data in results
+        if statistics_data is not None
+    }
+
+
+# Tasks are handed to workers while `sources` is still being consumed, so the
+# total number of tasks is not known up front.
+_TASK_CHUNK_SIZE: int = 8
+
+
+def collect_statistics(
+    sources: Iterable[Path],
+    strict_default: bool,
+    number_of_workers: int = 1,
+    cache_path: Optional[Path] = None,
+) -> Dict[str, StatisticsData]:
+    tasks = _unique_tasks(sources, strict_default, cache_path)
+    if number_of_workers <= 1:
+        return _statistics_by_path(map(_collect_statistics_for_task, tasks))
+    # Only look far enough ahead to decide whether a pool is worth it, so that
+    # lazily produced `sources` (e.g. a directory walk) overlap with parsing.
+    # Spinning up worker processes only pays off when every worker gets a
+    # couple of modules to parse; otherwise pool startup dominates.
+    first_tasks = list(itertools.islice(tasks, 2 * number_of_workers))
+    if len(first_tasks) < 2 * number_of_workers:
+        return _statistics_by_path(map(_collect_statistics_for_task, first_tasks))
+    with multiprocessing.Pool(number_of_workers) as pool:
+        # Use the ordered `imap` so that the output does not depend on scheduling.
+        return _statistics_by_path(
+            pool.imap(
+                _collect_statistics_for_task,
+                itertools.chain(first_tasks, tasks),
+                _TASK_CHUNK_SIZE,
+            )
+        )
+
+
 def collect_all_statistics(
     configuration: frontend_configuration.Base,
     statistics_arguments: command_arguments.StatisticsArguments,
@@ -267,13 +512,22 @@ def collect_all_statistics(
         paths = [configuration.get_local_root() or configuration.get_global_root()]
     else:
         paths = statistics_arguments.paths
-    return collect_statistics(
-        coverage_data.find_module_paths(
+    data = collect_statistics(
+        coverage_data.iter_module_paths(
             paths=paths,
             excludes=configuration.get_excludes(),
         ),
         strict_default=configuration.is_strict(),
+        number_of_workers=configuration.get_number_of_workers(),
+        cache_path=(
+            configuration.get_dot_pyre_directory() / STATISTICS_CACHE_NAME
+            if statistics_arguments.use_cache
+            else None
+        ),
     )
+    # Modules are collected in discovery order; report them in the same sorted
+    # order as `find_module_paths`.
+    return dict(sorted(data.items(), key=lambda item: Path(item[0])))
 
 
 @dataclasses.dataclass(frozen=True)
@@ -303,35 +557,31 @@ def aggregate_statistics(
         "line_count": 0,
     }
 
+    fixmes = 0
+    ignores = 0
+    strict = 0
+    unsafe = 0
+    # Accumulate every counter in a single pass over the per-module data.
     for statistics_data in data.values():
         annotation_counts = statistics_data.annotations.to_count_dict()
-        for key in aggregate_annotations.keys():
+        for key in aggregate_annotations:
             aggregate_annotations[key] += annotation_counts[key]
+        module_fixmes = statistics_data.fixmes
+        fixmes += len(module_fixmes.no_code) + len(module_fixmes.code)
+        module_ignores = statistics_data.ignores
+        ignores += len(module_ignores.no_code) + len(module_ignores.code)
+        mode = statistics_data.strict.mode
+        if mode == coverage_data.ModuleMode.STRICT:
+            strict += 1
+        elif mode == coverage_data.ModuleMode.UNSAFE:
+            unsafe += 1
 
     return AggregatedStatisticsData(
         annotations=aggregate_annotations,
-        fixmes=sum(
-            len(fixmes.no_code) + len(fixmes.code)
-            for fixmes in [statistics_data.fixmes for statistics_data in data.values()]
-        ),
-        ignores=sum(
-            len(ignores.no_code) + len(ignores.code)
-            for ignores in [
-                statistics_data.ignores for statistics_data in data.values()
-            ]
-        ),
-        strict=sum(
-            1 if strictness.mode == coverage_data.ModuleMode.STRICT else 0
-            for strictness in [
-                statistics_data.strict for statistics_data in data.values()
-            ]
-        ),
-        unsafe=sum(
-            1 if strictness.mode == coverage_data.ModuleMode.UNSAFE else 0
-            for strictness in [
-                statistics_data.strict for statistics_data in data.values()
-            ]
-        ),
+        fixmes=fixmes,
+        ignores=ignores,
+        strict=strict,
+        unsafe=unsafe,
     )
 
 
@@ -16,7 +16,7 @@ import logging
 from pathlib import Path
 
 from .. import daemon_socket, frontend_configuration, identifiers
-from ..language_server import connections
+from ..language_server import connections, daemon_connection
 from . import commands
 
 
@@ -38,6 +38,7 @@ def stop_message(flavor: identifiers.PyreFlavor) -> str:
 
 
 def stop_server(socket_path: Path, flavor: identifiers.PyreFlavor) -> None:
+    daemon_connection.default_connection_pool.evict(socket_path)
     with connections.connect(socket_path) as (
         input_channel,
         output_channel,
@@ -48,6 +49,7 @@ def stop_server(socket_path: Path, flavor: identifiers.PyreFlavor) -> None:
 
 
 def remove_socket_if_exists(socket_path: Path) -> None:
+    daemon_connection.default_connection_pool.evict(socket_path)
     try:
         socket_path.unlink()
     except FileNotFoundError:
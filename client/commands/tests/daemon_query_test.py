@@ -5,14 +5,17 @@
 
 # pyre-strict
 
+import json
+from typing import Union
+
 import testslide
 
-from ..daemon_query import InvalidQueryResponse, Response
+from ..daemon_query import _encode_query_request, InvalidQueryResponse, Response
 
 
 class ResponseTest(testslide.TestCase):
     def test_parse_response(self) -> None:
-        def assert_parsed(text: str, expected: Response) -> None:
+        def assert_parsed(text: Union[str, bytes], expected: Response) -> None:
             self.assertEqual(Response.parse(text), expected)
 
         def assert_not_parsed(text: str) -> None:
@@ -24,6 +27,9 @@ class ResponseTest(testslide.TestCase):
         assert_not_parsed("{}")
         assert_not_parsed("[]")
         assert_not_parsed('["Query"]')
+        assert_not_parsed('["Query", [], []]')
+        assert_not_parsed('["Derp", []]')
+        assert_not_parsed('{"Query": 1, "derp": 2}')
 
         assert_parsed('["Query", []]', Response(payload=[]))
         assert_parsed(
@@ -38,3 +44,18 @@ class ResponseTest(testslide.TestCase):
             '["Query",{"response":{"path":"/foo/bar.py"}}]',
             Response(payload={"response": {"path": "/foo/bar.py"}}),
         )
+        assert_parsed(
+            b'["Query",{"response":{"path":"/foo/bar.py"}}]',
+            Response(payload={"response": {"path": "/foo/bar.py"}}),
+        )
+
+    def test_encode_query_request(self) -> None:
+        for query_text in [
+            "types(path='/foo/bar.py')",
+            'defines("a\\b")',
+            "hover(path='/f\u00f6\u00f6.py', line=1)",
+            "",
+        ]:
+            self.assertEqual(
+                json.loads(_encode_query_request(query_text)), ["Query", query_text]
+            )
@@ -3,6 +3,7 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
+import sqlite3
 import tempfile
 import textwrap
 from pathlib import Path
@@ -611,6 +612,127 @@ class StatisticsTest(testslide.TestCase):
             self.assertIn(str(foo_path), data)
             self.assertIn(str(bar_path), data)
 
+            (root_path / "sub").mkdir()
+            data = statistics.collect_statistics(
+                [foo_path, bar_path, root_path / "sub" / ".." / "foo.py"],
+                strict_default=False,
+            )
+            self.assertEqual(list(data), [str(foo_path), str(bar_path)])
+
+    def test_collect_statistics_for_path(self) -> None:
+        code = textwrap.dedent(
+            """
+            # pyre-strict
+            class A:
+                x = 1
+                def foo(self, y: int):  # pyre-fixme[3]
+                    z: int = y  # pyre-ignore
+                    return z
+            def bar(a, b) -> None:  # pyre-fixme
+                pass
+            """
+        )
+        with tempfile.TemporaryDirectory() as root:
+            path = Path(root) / "a.py"
+            path.write_text(code)
+            result = statistics.collect_statistics_for_path(
+                statistics.CollectStatisticsArgs(path=path, strict_default=False)
+            )
+        module = coverage_data.module_from_code(code)
+        assert module is not None
+        self.assertEqual(
+            result,
+            statistics.StatisticsData(
+                annotations=statistics.AnnotationCountCollector().collect(module),
+                fixmes=statistics.FixmeCountCollector().collect(module),
+                ignores=statistics.IgnoreCountCollector().collect(module),
+                strict=coverage_data.collect_mode(module, False, path),
+            ),
+        )
+
+    def test_collect_statistics__cache(self) -> None:
+        with tempfile.TemporaryDirectory() as root:
+            root_path = Path(root)
+            path = root_path / "a.py"
+            path.write_text("def foo(x: int) -> int: ...\n")
+            cache_path = root_path / ".pyre" / statistics.STATISTICS_CACHE_NAME
+
+            data = statistics.collect_statistics(
+                [path], strict_default=False, cache_path=cache_path
+            )
+            self.assertTrue(cache_path.exists())
+
+            # A cache hit does not need to parse the module again.
+            self.mock_callable(coverage_data, "module_from_path").to_raise(
+                AssertionError("Module should not be parsed")
+            )
+            self.assertEqual(
+                statistics.collect_statistics(
+                    [path], strict_default=False, cache_path=cache_path
+                ),
+                data,
+            )
+
+    def test_collect_statistics__cache_invalidation(self) -> None:
+        with tempfile.TemporaryDirectory() as root:
+            root_path = Path(root)
+            path = root_path / "a.py"
+            path.write_text("def foo(x: int) -> int: ...\n")
+            cache_path = root_path / statistics.STATISTICS_CACHE_NAME
+            statistics.collect_statistics(
+                [path], strict_default=False, cache_path=cache_path
+            )
+            # Changing the strict default or the file invalidates the entry.
+            self.assertEqual(
+                statistics.collect_statistics(
+                    [path], strict_default=True, cache_path=cache_path
+                )[str(path)].strict.mode,
+                coverage_data.ModuleMode.STRICT,
+            )
+            path.write_text("def foo(x: int) -> int: ...\n\n\ndef bar(): ...\n")
+            self.assertEqual(
+                statistics.collect_statistics(
+                    [path], strict_default=False, cache_path=cache_path
+                )[str(path)].annotations.to_count_dict()["function_count"],
+                2,
+            )
+
+    def test_collect_statistics__stale_cache_entry(self) -> None:
+        with tempfile.TemporaryDirectory() as root:
+            root_path = Path(root)
+            path = root_path / "a.py"
+            path.write_text("def foo(x: int) -> int: ...\n")
+            cache_path = root_path / statistics.STATISTICS_CACHE_NAME
+            data = statistics.collect_statistics(
+                [path], strict_default=False, cache_path=cache_path
+            )
+            # Simulate an entry pickled by a client whose classes no longer exist.
+            with sqlite3.connect(str(cache_path)) as connection:
+                connection.execute(
+                    "UPDATE statistics SET data = ?",
+                    (b"cno_such_module\nStatisticsData\n.",),
+                )
+            self.assertEqual(
+                statistics.collect_statistics(
+                    [path], strict_default=False, cache_path=cache_path
+                ),
+                data,
+            )
+
+    def test_collect_statistics__multiple_workers(self) -> None:
+        with tempfile.TemporaryDirectory() as root:
+            root_path = Path(root)
+            paths = [root_path / f"s{index}.py" for index in range(5)]
+            for index, path in enumerate(paths):
+                path.write_text(f"# pyre-strict\ndef foo{index}(x: int) -> int: ...\n")
+
+            self.assertEqual(
+                statistics.collect_statistics(
+                    paths, strict_default=False, number_of_workers=2
+                ),
+                statistics.collect_statistics(paths, strict_default=False),
+            )
+
     def test_aggregate_statistics__single_file(self) -> None:
         with tempfile.TemporaryDirectory() as root:
             root_path = Path(root)
@@ -16,14 +16,29 @@ This module defines shared logic used by Pyre coverage tooling, including
 
 from __future__ import annotations
 
+import contextlib
 import dataclasses
-import itertools
+import functools
 import logging
+import os
 import re
 from enum import Enum
 from pathlib import Path
 from re import compile
-from typing import Dict, Iterable, List, Optional, Pattern, Sequence
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Pattern,
+    Sequence,
+    Set,
+    Tuple,
+    Type,
+    Union,
+)
 
 import libcst
 from libcst.metadata import CodeRange, PositionProvider
@@ -169,6 +184,92 @@ class VisitorWithPositionData(libcst.CSTVisitor):
         return Location.from_code_range(self.get_metadata(PositionProvider, node))
 
 
+_DispatchCache: TypeAlias = Dict[
+    Tuple[Type[libcst.CSTNode], Optional[str]],
+    List[Callable[[libcst.CSTNode], object]],
+]
+
+
+def _overrides(visitor: libcst.CSTVisitor, name: str) -> bool:
+    # `libcst.CSTVisitor` defines a no-op `visit_*`/`leave_*` for every node
+    # type and attribute, so checking for the attribute alone is not enough.
+    return getattr(type(visitor), name, None) is not getattr(
+        libcst.CSTVisitor, name, None
+    )
+
+
+class CompositeVisitor(libcst.CSTVisitor):
+    """
+    Run several visitors in a single traversal of a module, instead of walking
+    the whole tree once per visitor. Metadata is resolved for each of the
+    wrapped visitors, and the wrapper's cache ensures each provider only runs
+    once.
+
+    Each node is only dispatched to the visitors that override the matching
+    `visit_*`/`leave_*` method, including attribute methods such as
+    `visit_FunctionDef_body`. The wrapped visitors must not prune the
+    traversal (i.e. their `visit_*` methods must not return `False`), since
+    all of them see every node, and must not override `on_visit`/`on_leave`
+    themselves.
+    """
+
+    def __init__(self, visitors: Sequence[libcst.CSTVisitor]) -> None:
+        self.visitors: Sequence[libcst.CSTVisitor] = visitors
+        self._visit_functions: _DispatchCache = {}
+        self._leave_functions: _DispatchCache = {}
+        self._visit_attribute_functions: _DispatchCache = {}
+        self._leave_attribute_functions: _DispatchCache = {}
+
+    def _functions(
+        self,
+        cache: _DispatchCache,
+        prefix: str,
+        node: libcst.CSTNode,
+        attribute: Optional[str] = None,
+    ) -> List[Callable[[libcst.CSTNode], object]]:
+        key = (type(node), attribute)
+        functions = cache.get(key)
+        if functions is None:
+            name = f"{prefix}_{type(node).__name__}"
+            if attribute is not None:
+                name = f"{name}_{attribute}"
+            functions = [
+                getattr(visitor, name)
+                for visitor in self.visitors
+                if _overrides(visitor, name)
+            ]
+            cache[key] = functions
+        return functions
+
+    @contextlib.contextmanager
+    def resolve(self, wrapper: libcst.MetadataWrapper) -> Iterator[None]:
+        with contextlib.ExitStack() as stack:
+            for visitor in self.visitors:
+                stack.enter_context(visitor.resolve(wrapper))
+            yield
+
+    def on_visit(self, node: libcst.CSTNode) -> bool:
+        for visit in self._functions(self._visit_functions, "visit", node):
+            visit(node)
+        return True
+
+    def on_leave(self, original_node: libcst.CSTNode) -> None:
+        for leave in self._functions(self._leave_functions, "leave", original_node):
+            leave(original_node)
+
+    def on_visit_attribute(self, node: libcst.CSTNode, attribute: str) -> None:
+        for visit in self._functions(
+            self._visit_attribute_functions, "visit", node, attribute
+        ):
+            visit(node)
+
+    def on_leave_attribute(self, original_node: libcst.CSTNode, attribute: str) -> None:
+        for leave in self._functions(
+            self._leave_attribute_functions, "leave", original_node, attribute
+        ):
+            leave(original_node)
+
+
 class AnnotationContext:
     class_name_stack: List[str]
     define_depth: int
@@ -232,30 +333,49 @@ class AnnotationContext:
         return len(self.class_name_stack) > 0 and not self.static_define_depth > 0
 
 
-class ExplicitAnyChecker(libcst.CSTVisitor):
-    """
-    Checks for explicit Any usage in code.
+@functools.lru_cache(maxsize=None)
+def _node_field_names(node_type: Type[libcst.CSTNode]) -> Tuple[str, ...]:
+    return tuple(field.name for field in dataclasses.fields(node_type))
+
+
+def _iter_nodes(root: libcst.CSTNode) -> Iterator[libcst.CSTNode]:
     """
+    Yield `root` and all of its transitive children, in no particular order.
 
-    def __init__(self) -> None:
-        self.has_explicit_any: bool = False
+    Unlike `CSTNode.visit`, this does not rebuild every node of the subtree
+    on the way back up, which makes it much cheaper for read-only checks that
+    do not care about the order in which nodes are seen.
+    """
+    stack: List[libcst.CSTNode] = [root]
+    while len(stack) > 0:
+        node = stack.pop()
+        yield node
+        for field_name in _node_field_names(type(node)):
+            value = getattr(node, field_name)
+            if isinstance(value, libcst.CSTNode):
+                stack.append(value)
+            elif isinstance(value, (list, tuple)):
+                stack.extend(
+                    element for element in value if isinstance(element, libcst.CSTNode)
+                )
 
-    def visit_Name(self, node: libcst.Name) -> None:
-        if node.value == "Any":
-            self.has_explicit_any = True
 
-    def contains_explicit_any(self) -> bool:
-        return self.has_explicit_any
+_IMPLICITLY_ANNOTATED_VALUE_TYPES: Tuple[Type[libcst.CSTNode], ...] = (
+    libcst.BaseNumber,
+    libcst.BaseString,
+    libcst.Name,
+    libcst.Call,
+)
 
 
 class AnnotationCollector(VisitorWithPositionData):
     path: str = ""
 
     def contains_explicit_any(self, node: Optional[libcst.CSTNode]) -> bool:
-        visitor = ExplicitAnyChecker()
-        if node is not None:
-            node.visit(visitor)
-        return visitor.contains_explicit_any()
+        return node is not None and any(
+            isinstance(child, libcst.Name) and child.value == "Any"
+            for child in _iter_nodes(node)
+        )
 
     def __init__(self) -> None:
         self.context: AnnotationContext = AnnotationContext()
@@ -276,12 +396,16 @@ class AnnotationCollector(VisitorWithPositionData):
         self,
         params: Sequence[libcst.Param],
     ) -> List[ParameterAnnotationInfo]:
+        # Bind the per-parameter helpers once, since this runs for every
+        # function definition.
+        location = self.location
+        contains_explicit_any = self.contains_explicit_any
         return [
             ParameterAnnotationInfo(
                 name=node.name.value,
                 is_annotated=node.annotation is not None,
-                location=self.location(node),
-                contains_explicit_any=self.contains_explicit_any(node),
+                location=location(node),
+                contains_explicit_any=contains_explicit_any(node),
             )
             for node in params
         ]
@@ -306,8 +430,9 @@ class AnnotationCollector(VisitorWithPositionData):
             params=node.params.params,
         )
 
+        is_non_static_method = self.context.is_non_static_method()
         annotation_status = FunctionAnnotationStatus.from_function_data(
-            is_non_static_method=self.context.is_non_static_method(),
+            is_non_static_method=is_non_static_method,
             is_return_annotated=returns.is_annotated,
             parameters=node.params.params,
         )
@@ -318,7 +443,7 @@ class AnnotationCollector(VisitorWithPositionData):
                 annotation_status,
                 returns,
                 parameters,
-                self.context.is_non_static_method(),
+                is_non_static_method,
             )
         )
 
@@ -328,41 +453,23 @@ class AnnotationCollector(VisitorWithPositionData):
     def visit_Assign(self, node: libcst.Assign) -> None:
         if self.context.assignments_are_function_local():
             return
-        implicitly_annotated_literal = False
-        if isinstance(node.value, libcst.BaseNumber) or isinstance(
-            node.value, libcst.BaseString
-        ):
-            implicitly_annotated_literal = True
-        implicitly_annotated_value = False
-        if isinstance(node.value, libcst.Name) or isinstance(node.value, libcst.Call):
-            # An over-approximation of global values that do not need an explicit
-            # annotation. Erring on the side of reporting these as annotated to
-            # avoid showing false positives to users.
-            implicitly_annotated_value = True
-        location = self.location(node)
+        # Literals are implicitly annotated. Names and calls are an
+        # over-approximation of global values that do not need an explicit
+        # annotation; we err on the side of reporting these as annotated to
+        # avoid showing false positives to users.
+        is_annotated = isinstance(node.value, _IMPLICITLY_ANNOTATED_VALUE_TYPES)
+        annotation_info = AnnotationInfo(
+            node,
+            is_annotated,
+            self.location(node),
+            contains_explicit_any=self.contains_explicit_any(node),
+        )
         if self.context.assignments_are_class_level():
-            is_annotated = implicitly_annotated_literal or implicitly_annotated_value
-            self.attributes.append(
-                AnnotationInfo(
-                    node,
-                    is_annotated,
-                    location,
-                    contains_explicit_any=self.contains_explicit_any(node),
-                )
-            )
+            self.attributes.append(annotation_info)
         else:
-            is_annotated = implicitly_annotated_literal or implicitly_annotated_value
-            self.globals.append(
-                AnnotationInfo(
-                    node,
-                    is_annotated,
-                    location,
-                    contains_explicit_any=self.contains_explicit_any(node),
-                )
-            )
+            self.globals.append(annotation_info)
 
     def visit_AnnAssign(self, node: libcst.AnnAssign) -> None:
-        node.annotation
         if self.context.assignments_are_function_local():
             return
         location = self.location(node)
@@ -410,10 +517,10 @@ class TypeErrorSuppression(json_mixins.SnakeCaseAndExcludeJsonMixin):
 
 class SuppressionCollector(VisitorWithPositionData):
 
-    suppression_regexes: Dict[SuppressionKind, str] = {
-        SuppressionKind.PYRE_FIXME: r".*# *pyre-fixme(\[(\d* *,? *)*\])?",
-        SuppressionKind.PYRE_IGNORE: r".*# *pyre-ignore(\[(\d* *,? *)*\])?",
-        SuppressionKind.TYPE_IGNORE: r".*# *type: ignore",
+    suppression_regexes: Dict[SuppressionKind, Pattern[str]] = {
+        SuppressionKind.PYRE_FIXME: compile(r".*# *pyre-fixme(\[(\d* *,? *)*\])?"),
+        SuppressionKind.PYRE_IGNORE: compile(r".*# *pyre-ignore(\[(\d* *,? *)*\])?"),
+        SuppressionKind.TYPE_IGNORE: compile(r".*# *type: ignore"),
     }
 
     def __init__(self) -> None:
@@ -442,9 +549,15 @@ class SuppressionCollector(VisitorWithPositionData):
         self,
         node: libcst.Comment,
     ) -> Iterable[TypeErrorSuppression]:
+        value = node.value
+        # Most comments are not suppressions: reject them with a substring test
+        # before running any of the `suppression_regexes`. A comment may contain
+        # several kinds of suppression, so each regex still has to be tried.
+        if "pyre-" not in value and "type: ignore" not in value:
+            return
         location = self.location(node)
         for suppression_kind, regex in self.suppression_regexes.items():
-            match = re.match(regex, node.value)
+            match = regex.match(value)
             if match is not None:
                 yield TypeErrorSuppression(
                     kind=suppression_kind,
@@ -461,11 +574,12 @@ class SuppressionCollector(VisitorWithPositionData):
 
 
 class ModuleModeCollector(VisitorWithPositionData):
-    unsafe_regex: Pattern[str] = compile(r" ?#+ *pyre-unsafe")
-    strict_regex: Pattern[str] = compile(r" ?#+ *pyre-strict")
-    ignore_all_regex: Pattern[str] = compile(r" ?#+ *pyre-ignore-all-errors")
-    ignore_all_by_code_regex: Pattern[str] = compile(
-        r" ?#+ *pyre-ignore-all-errors\[[0-9]+[0-9, ]*\]"
+    # Only one of the alternatives can match a given comment. A
+    # `pyre-ignore-all-errors` with error codes only silences those codes, so
+    # it does not change the module mode.
+    mode_regex: Pattern[str] = compile(
+        r" ?#+ *pyre-(?:(?P<strict>strict)|(?P<unsafe>unsafe)"
+        r"|(?P<ignore_all>ignore-all-errors)(?P<by_code>\[[0-9]+[0-9, ]*\])?)"
     )
     is_generated_regex: Pattern[str] = compile(r"@" + "generated")
 
@@ -484,21 +598,30 @@ class ModuleModeCollector(VisitorWithPositionData):
         return self.mode == ModuleMode.STRICT
 
     def visit_Comment(self, node: libcst.Comment) -> None:
-        if self.strict_regex.match(node.value):
-            self.mode = ModuleMode.STRICT
-            self.explicit_comment_line = self.location(node).start_line
-        elif self.unsafe_regex.match(node.value):
-            self.mode = ModuleMode.UNSAFE
-            self.explicit_comment_line = self.location(node).start_line
-        elif self.ignore_all_regex.match(
-            node.value
-        ) and not self.ignore_all_by_code_regex.match(node.value):
-            self.mode = ModuleMode.IGNORE_ALL
-            self.explicit_comment_line = self.location(node).start_line
+        match = self.mode_regex.match(node.value) if "pyre-" in node.value else None
+        if match is not None:
+            if match.group("strict") is not None:
+                self.mode = ModuleMode.STRICT
+                self.explicit_comment_line = self.location(node).start_line
+            elif match.group("unsafe") is not None:
+                self.mode = ModuleMode.UNSAFE
+                self.explicit_comment_line = self.location(node).start_line
+            elif match.group("by_code") is None:
+                self.mode = ModuleMode.IGNORE_ALL
+                self.explicit_comment_line = self.location(node).start_line
 
         if self.is_generated_regex.search(node.value):
             self.is_generated = True
 
+    def to_module_mode_info(self, path: Path, ignored: bool = False) -> ModuleModeInfo:
+        is_test_regex = compile(r".*\/(test|tests)\/.*\.py$")
+        return ModuleModeInfo(
+            mode=ModuleMode.IGNORE_ALL if ignored else self.mode,
+            explicit_comment_line=self.explicit_comment_line,
+            is_generated=self.is_generated,
+            is_test=bool(is_test_regex.match(str(path))),
+        )
+
 
 def collect_mode(
     module: libcst.MetadataWrapper,
@@ -506,16 +629,9 @@ def collect_mode(
     path: Path,
     ignored: bool = False,  # means the module was ignored in the pyre configuration
 ) -> ModuleModeInfo:
-    is_test_regex = compile(r".*\/(test|tests)\/.*\.py$")
     visitor = ModuleModeCollector(strict_by_default)
     module.visit(visitor)
-    mode = ModuleMode.IGNORE_ALL if ignored else visitor.mode
-    return ModuleModeInfo(
-        mode=mode,
-        explicit_comment_line=visitor.explicit_comment_line,
-        is_generated=visitor.is_generated,
-        is_test=bool(is_test_regex.match(str(path))),
-    )
+    return visitor.to_module_mode_info(path, ignored)
 
 
 def collect_functions(
@@ -534,47 +650,171 @@ def collect_suppressions(
     return visitor.suppressions
 
 
-def module_from_code(code: str) -> Optional[libcst.MetadataWrapper]:
+def collect_all(
+    module: libcst.MetadataWrapper,
+    strict_by_default: bool,
+    path: Path,
+    ignored: bool = False,
+) -> Tuple[
+    ModuleModeInfo, Sequence[FunctionAnnotationInfo], Sequence[TypeErrorSuppression]
+]:
+    """
+    Equivalent to calling `collect_mode`, `collect_functions` and
+    `collect_suppressions`, but only traverses `module` once.
+    """
+    mode_visitor = ModuleModeCollector(strict_by_default)
+    annotation_visitor = AnnotationCollector()
+    suppression_visitor = SuppressionCollector()
+    module.visit(
+        CompositeVisitor([mode_visitor, annotation_visitor, suppression_visitor])
+    )
+    return (
+        mode_visitor.to_module_mode_info(path, ignored),
+        annotation_visitor.functions,
+        suppression_visitor.suppressions,
+    )
+
+
+def module_from_code(code: Union[str, bytes]) -> Optional[libcst.MetadataWrapper]:
     try:
         raw_module = libcst.parse_module(code)
-        return libcst.MetadataWrapper(raw_module)
-    except Exception:
-        LOG.exception("Error reading code at path %s.", code)
+        # Nothing else holds on to `raw_module`, and the collectors never
+        # mutate the tree, so the defensive deep copy can be skipped.
+        return libcst.MetadataWrapper(raw_module, unsafe_skip_copy=True)
+    except Exception as error:
+        # Broken (often generated) files are common enough that formatting a
+        # traceback for each of them is noticeable; only do so when debugging.
+        LOG.warning("Error parsing code: %s", error)
+        LOG.debug("Parsing failure traceback:", exc_info=True)
         return None
 
 
+def _read_source(path: Path) -> bytes:
+    # The whole file is read at once, so there is no point in going through
+    # the buffered and text layers of `open`. LibCST takes care of decoding
+    # (including PEP 263 encoding declarations) when given bytes.
+    with open(path, "rb", buffering=0) as source_file:
+        return source_file.readall()
+
+
 def module_from_path(path: Path) -> Optional[libcst.MetadataWrapper]:
     try:
-        return module_from_code(path.read_text())
+        return module_from_code(_read_source(path))
     except FileNotFoundError:
         return None
 
 
-def _is_excluded(
-    path: Path,
-    excludes: Sequence[str],
-) -> bool:
+@functools.lru_cache(maxsize=32)
+def _compile_excludes(excludes: Tuple[str, ...]) -> Tuple[Pattern[str], ...]:
+    """
+    Combine all `excludes` into a single alternation, so that each path is
+    matched once rather than once per exclude pattern. If the patterns cannot
+    be combined (numbered backreferences would shift, and inline flags must
+    come first), compile them individually instead. Return no patterns when
+    nothing can be excluded.
+
+    The result is cached, since the same `excludes` from the configuration
+    tend to be used for every call to `find_module_paths`.
+    """
+    if len(excludes) == 0:
+        return ()
+    if not any(re.search(r"\\\d", exclude) is not None for exclude in excludes):
+        try:
+            return (compile("|".join(f"(?:{exclude})" for exclude in excludes)),)
+        except re.error:
+            pass
     try:
-        return any(
-            [re.match(exclude_pattern, str(path)) for exclude_pattern in excludes]
-        )
+        return tuple(compile(exclude) for exclude in excludes)
     except re.error:
         LOG.warning("Could not parse `excludes`: %s", excludes)
-        return False
+        return ()
+
+
+def _is_excluded(
+    path: str,
+    excludes: Tuple[Pattern[str], ...],
+) -> bool:
+    return any(exclude.match(path) is not None for exclude in excludes)
 
 
 def _should_ignore(
     path: Path,
-    excludes: Sequence[str],
+    excludes: Tuple[Pattern[str], ...],
 ) -> bool:
+    # `PurePath.suffix` and `PurePath.name` re-split the path on every access;
+    # plain string operations are enough here.
+    path_string = str(path)
+    name = os.path.basename(path_string)
     return (
-        path.suffix != ".py"
-        or path.name.startswith("__")
-        or path.name.startswith(".")
-        or _is_excluded(path, excludes)
+        not name.endswith(".py")
+        or name.startswith(("__", "."))
+        or _is_excluded(path_string, excludes)
     )
 
 
+def _find_module_paths_in_directory(
+    root: Path,
+    excludes: Tuple[Pattern[str], ...],
+    seen: Set[str],
+) -> Iterator[Path]:
+    """
+    Recursively find all module paths under `root` that `_should_ignore` would
+    keep and that are not in `seen` yet, without descending into symbolic
+    links to directories. This matches filtering `root.glob("**/*.py")`, but
+    relies on the file types cached by `os.scandir` and works on plain
+    strings, so that no `Path` needs to be created for files that get filtered
+    out.
+    """
+    directories = [os.fspath(root)]
+    while len(directories) > 0:
+        directory = directories.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    # Keep the same spelling as `str(Path(...))`, which drops a
+                    # leading `./`.
+                    path = entry.path if directory != "." else entry.name
+                    if entry.is_dir(follow_symlinks=False):
+                        directories.append(path)
+                        continue
+                    name = entry.name
+                    if (
+                        name.endswith(".py")
+                        and not name.startswith(("__", "."))
+                        and not entry.is_dir()
+                        and path not in seen
+                        and not _is_excluded(path, excludes)
+                    ):
+                        seen.add(path)
+                        yield Path(path)
+        except PermissionError:
+            continue
+
+
+def iter_module_paths(
+    paths: Iterable[Path],
+    excludes: Sequence[str],
+) -> Iterator[Path]:
+    """
+    Lazily produce the same module paths as `find_module_paths`, in the order
+    in which they are discovered. This lets callers start processing modules
+    while directories are still being walked.
+    """
+    compiled_excludes = _compile_excludes(tuple(excludes))
+
+    # Deduplicate on the string form of each path rather than on `Path` itself,
+    # since hashing a string is much cheaper than hashing a `Path`.
+    seen: Set[str] = set()
+    for path in paths:
+        if not path.is_dir():
+            path_string = str(path)
+            if path_string not in seen and not _should_ignore(path, compiled_excludes):
+                seen.add(path_string)
+                yield path
+            continue
+        yield from _find_module_paths_in_directory(path, compiled_excludes, seen)
+
+
 def find_module_paths(
     paths: Iterable[Path],
     excludes: Sequence[str],
@@ -585,26 +825,4 @@ def find_module_paths(
     paths after recursively expanding directories, and ignoring directory
     exclusions specified in `excludes`.
     """
-
-    def _get_paths_for_file(target_file: Path) -> Iterable[Path]:
-        return [target_file] if not _should_ignore(target_file, excludes) else []
-
-    def _get_paths_in_directory(target_directory: Path) -> Iterable[Path]:
-        return (
-            path
-            for path in target_directory.glob("**/*.py")
-            if not _should_ignore(path, excludes)
-        )
-
-    return sorted(
-        set(
-            itertools.chain.from_iterable(
-                (
-                    _get_paths_for_file(path)
-                    if not path.is_dir()
-                    else _get_paths_in_directory(path)
-                )
-                for path in paths
-            )
-        )
-    )
+    return sorted(iter_module_paths(paths, excludes))
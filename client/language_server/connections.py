@@ -14,13 +14,24 @@ connections in language servers.
 
 import abc
 import asyncio
+import codecs
 import contextlib
 import io
 import logging
 import socket
 import sys
 from pathlib import Path
-from typing import AsyncIterator, BinaryIO, Iterator, List, Optional, TextIO, Tuple
+from typing import (
+    AsyncIterator,
+    BinaryIO,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    TextIO,
+    Tuple,
+)
 
 LOG: logging.Logger = logging.getLogger(__name__)
 
@@ -30,7 +41,7 @@ class ConnectionFailure(Exception):
 
 
 @contextlib.contextmanager
-def _connect_bytes(
+def connect_bytes(
     socket_path: Path,
 ) -> Iterator[Tuple[BinaryIO, BinaryIO]]:
     """
@@ -65,7 +76,7 @@ def connect(
     socket_path: Path,
 ) -> Iterator[Tuple[TextIO, TextIO]]:
     """
-    This is a line-oriented higher-level API than `connect`. It can be used
+    This is a line-oriented higher-level API than `connect_bytes`. It can be used
     when the caller does not want to deal with the complexity of binary I/O.
 
     The behavior is the same as `connect`, except the streams that are created
@@ -74,7 +85,7 @@ def connect(
     that the streams will automatically be flushed once the newline character
     is encountered.
     """
-    with _connect_bytes(socket_path) as (input_channel, output_channel):
+    with connect_bytes(socket_path) as (input_channel, output_channel):
         yield (
             io.TextIOWrapper(
                 input_channel,
@@ -137,6 +148,15 @@ class AsyncBytesWriter(abc.ABC):
         """
         raise NotImplementedError()
 
+    async def write_many(self, chunks: Sequence[bytes]) -> None:
+        """
+        Write all of the given chunks to the underlying channel as a single
+        logical write, and flush once at the end. Subclasses may override this
+        to hand all chunks to the transport at once instead of concatenating
+        them first.
+        """
+        await self.write(b"".join(chunks))
+
     @abc.abstractmethod
     async def close(self) -> None:
         """
@@ -146,6 +166,14 @@ class AsyncBytesWriter(abc.ABC):
         raise NotImplementedError()
 
 
+def _is_ascii_compatible(encoding: str) -> bool:
+    """
+    Return whether ASCII-only data means the same thing in the given encoding
+    as it does in ASCII, so that the cheaper ASCII codec can be used instead.
+    """
+    return codecs.lookup(encoding).name == "utf-8"
+
+
 class AsyncTextReader:
     """
     An adapter for `AsyncBytesReader` that decodes everything it reads immediately
@@ -156,6 +184,8 @@ class AsyncTextReader:
     bytes_reader: AsyncBytesReader
     encoding: str
     errors: str
+    _ascii_compatible: bool
+    _separator_cache: Dict[str, bytes]
 
     def __init__(
         self,
@@ -166,19 +196,31 @@ class AsyncTextReader:
         self.bytes_reader = bytes_reader
         self.encoding = encoding
         self.errors = errors
+        self._ascii_compatible = _is_ascii_compatible(encoding)
+        self._separator_cache = {}
+
+    def _decode(self, data: bytes) -> str:
+        # Most of the traffic we deal with is ASCII-only JSON, for which the
+        # ASCII codec is a plain copy.
+        if self._ascii_compatible and data.isascii():
+            return data.decode("ascii")
+        return data.decode(self.encoding, errors=self.errors)
 
     async def read_until(self, separator: str = "\n") -> str:
-        separator_bytes = separator.encode(self.encoding)
+        separator_bytes = self._separator_cache.get(separator)
+        if separator_bytes is None:
+            separator_bytes = separator.encode(self.encoding)
+            self._separator_cache[separator] = separator_bytes
         result_bytes = await self.bytes_reader.read_until(separator_bytes)
-        return result_bytes.decode(self.encoding, errors=self.errors)
+        return self._decode(result_bytes)
 
     async def read_exactly(self, count: int) -> str:
         result_bytes = await self.bytes_reader.read_exactly(count)
-        return result_bytes.decode(self.encoding, errors=self.errors)
+        return self._decode(result_bytes)
 
     async def readline(self) -> str:
         result_bytes = await self.bytes_reader.readline()
-        return result_bytes.decode(self.encoding, errors=self.errors)
+        return self._decode(result_bytes)
 
 
 class AsyncTextWriter:
@@ -190,14 +232,23 @@ class AsyncTextWriter:
 
     bytes_writer: AsyncBytesWriter
     encoding: str
+    _ascii_compatible: bool
 
     def __init__(self, bytes_writer: AsyncBytesWriter, encoding: str = "utf-8") -> None:
         self.bytes_writer = bytes_writer
         self.encoding = encoding
+        self._ascii_compatible = _is_ascii_compatible(encoding)
+
+    def _encode(self, data: str) -> bytes:
+        if self._ascii_compatible and data.isascii():
+            return data.encode("ascii")
+        return data.encode(self.encoding)
 
     async def write(self, data: str) -> None:
-        data_bytes = data.encode(self.encoding)
-        await self.bytes_writer.write(data_bytes)
+        await self.bytes_writer.write(self._encode(data))
+
+    async def write_many(self, chunks: Sequence[str]) -> None:
+        await self.bytes_writer.write_many([self._encode(chunk) for chunk in chunks])
 
 
 class MemoryBytesReader(AsyncBytesReader):
@@ -213,18 +264,14 @@ class MemoryBytesReader(AsyncBytesReader):
         self._cursor = 0
 
     async def read_until(self, separator: bytes = b"\n") -> bytes:
-        result = bytearray()
         start_index = self._cursor
-        end_index = len(self._data)
-        for index in range(start_index, end_index):
-            byte = self._data[index]
-            result.append(byte)
-            if result.endswith(separator):
-                self._cursor = index + 1
-                return bytes(result)
+        separator_index = self._data.find(separator, start_index)
+        if separator_index >= 0:
+            self._cursor = separator_index + len(separator)
+            return self._data[start_index : self._cursor]
 
-        self._cursor = end_index
-        raise asyncio.IncompleteReadError(bytes(result), None)
+        self._cursor = len(self._data)
+        raise asyncio.IncompleteReadError(self._data[start_index:], None)
 
     async def read_exactly(self, count: int) -> bytes:
         old_cursor = self._cursor
@@ -308,6 +355,12 @@ class StreamBytesWriter(AsyncBytesWriter):
         self.stream_writer.write(data)
         await self.stream_writer.drain()
 
+    async def write_many(self, chunks: Sequence[bytes]) -> None:
+        # Queue every chunk before draining, so the transport can send them
+        # together rather than paying for one drain per chunk.
+        self.stream_writer.writelines(chunks)
+        await self.stream_writer.drain()
+
     async def close(self) -> None:
         self.stream_writer.close()
         await self._stream_writer_wait_closed()
@@ -334,6 +387,212 @@ class StreamBytesWriter(AsyncBytesWriter):
                 await asyncio.sleep(0)
 
 
+class _BufferedReaderProtocol(asyncio.BufferedProtocol):
+    """
+    An `asyncio.BufferedProtocol` that receives data straight into a fixed,
+    preallocated chunk and accumulates it in a single `bytearray` until it is
+    consumed. Unlike `asyncio.StreamReader`, this does not allocate a new
+    `bytes` object per `recv`, and separators are searched for in place.
+    Transports that do not support buffered protocols fall back to
+    `data_received`, which appends to the same `bytearray`.
+
+    The protocol also implements write flow control, so that it can back both
+    a `ProtocolBytesReader` and a `ProtocolBytesWriter`.
+    """
+
+    def __init__(self, chunk_size: int = 2**16) -> None:
+        self._loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        self._chunk_size = chunk_size
+        self._receive_view: memoryview = memoryview(bytearray(chunk_size))
+        self._data = bytearray()
+        self._eof = False
+        self._exception: Optional[BaseException] = None
+        self._data_waiter: Optional[asyncio.Future[None]] = None
+        self._reading_paused = False
+        self._writing_paused = False
+        self._drain_waiter: Optional[asyncio.Future[None]] = None
+        self._closed: asyncio.Future[None] = self._loop.create_future()
+        self._transport: Optional[asyncio.BaseTransport] = None
+
+    # Callbacks invoked by the transport.
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        self._transport = transport
+
+    def get_buffer(self, sizehint: int) -> memoryview:
+        return self._receive_view
+
+    def buffer_updated(self, nbytes: int) -> None:
+        self._data += self._receive_view[:nbytes]
+        self._on_data_appended()
+
+    def data_received(self, data: bytes) -> None:
+        # Not every transport supports buffered protocols (e.g. pipe
+        # transports do not), in which case data is handed to us as `bytes`.
+        self._data += data
+        self._on_data_appended()
+
+    def _on_data_appended(self) -> None:
+        self._wake_data_waiter()
+        # Stop reading if the consumer falls too far behind, mirroring the
+        # flow control of `asyncio.StreamReader`.
+        if (
+            not self._reading_paused
+            and len(self._data) > 2 * self._chunk_size
+            and isinstance(self._transport, asyncio.ReadTransport)
+        ):
+            self._transport.pause_reading()
+            self._reading_paused = True
+
+    def eof_received(self) -> bool:
+        self._eof = True
+        self._wake_data_waiter()
+        # Keep the transport open so that pending writes can still go out.
+        return True
+
+    def connection_lost(self, exception: Optional[Exception]) -> None:
+        self._eof = True
+        if exception is not None:
+            self._exception = exception
+        self._wake_data_waiter()
+        self._wake_drain_waiter()
+        if not self._closed.done():
+            self._closed.set_result(None)
+
+    def pause_writing(self) -> None:
+        self._writing_paused = True
+
+    def resume_writing(self) -> None:
+        self._writing_paused = False
+        self._wake_drain_waiter()
+
+    # APIs used by readers and writers.
+
+    def _wake_data_waiter(self) -> None:
+        waiter = self._data_waiter
+        if waiter is not None:
+            self._data_waiter = None
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def _wake_drain_waiter(self) -> None:
+        waiter = self._drain_waiter
+        if waiter is not None:
+            self._drain_waiter = None
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def _maybe_resume_reading(self) -> None:
+        if (
+            self._reading_paused
+            and len(self._data) <= self._chunk_size
+            and isinstance(self._transport, asyncio.ReadTransport)
+        ):
+            self._transport.resume_reading()
+            self._reading_paused = False
+
+    async def _wait_for_data(self) -> None:
+        if self._data_waiter is not None:
+            raise RuntimeError("Another coroutine is already waiting for data")
+        # The caller needs more data than what is buffered, so reading must not
+        # stay paused regardless of how much is already buffered.
+        if self._reading_paused and isinstance(self._transport, asyncio.ReadTransport):
+            self._transport.resume_reading()
+            self._reading_paused = False
+        self._data_waiter = self._loop.create_future()
+        try:
+            await self._data_waiter
+        finally:
+            self._data_waiter = None
+
+    def _consume(self, count: int) -> bytes:
+        result = bytes(self._data[:count])
+        del self._data[:count]
+        self._maybe_resume_reading()
+        return result
+
+    async def read_until(self, separator: bytes) -> bytes:
+        search_start = 0
+        while True:
+            separator_index = self._data.find(separator, search_start)
+            if separator_index >= 0:
+                return self._consume(separator_index + len(separator))
+            if self._exception is not None:
+                raise self._exception
+            if self._eof:
+                raise asyncio.IncompleteReadError(self._consume(len(self._data)), None)
+            # Do not re-scan what has already been searched, but allow for a
+            # separator that straddles the old and the new data.
+            search_start = max(0, len(self._data) - len(separator) + 1)
+            await self._wait_for_data()
+
+    async def read_exactly(self, count: int) -> bytes:
+        while len(self._data) < count:
+            if self._exception is not None:
+                raise self._exception
+            if self._eof:
+                raise asyncio.IncompleteReadError(self._consume(len(self._data)), count)
+            await self._wait_for_data()
+        return self._consume(count)
+
+    async def drain(self) -> None:
+        if self._closed.done():
+            raise ConnectionResetError("Connection lost")
+        if not self._writing_paused:
+            return
+        self._drain_waiter = self._loop.create_future()
+        await self._drain_waiter
+
+    async def wait_closed(self) -> None:
+        await self._closed
+
+
+class ProtocolBytesReader(AsyncBytesReader):
+    """
+    An implementation of `AsyncBytesReader` based on `_BufferedReaderProtocol`.
+    """
+
+    _protocol: _BufferedReaderProtocol
+
+    def __init__(self, protocol: _BufferedReaderProtocol) -> None:
+        self._protocol = protocol
+
+    async def read_until(self, separator: bytes = b"\n") -> bytes:
+        return await self._protocol.read_until(separator)
+
+    async def read_exactly(self, count: int) -> bytes:
+        return await self._protocol.read_exactly(count)
+
+
+class ProtocolBytesWriter(AsyncBytesWriter):
+    """
+    An implementation of `AsyncBytesWriter` that writes directly into an
+    `asyncio.WriteTransport`, relying on `_BufferedReaderProtocol` for flow
+    control.
+    """
+
+    _transport: asyncio.WriteTransport
+    _protocol: _BufferedReaderProtocol
+
+    def __init__(
+        self, transport: asyncio.WriteTransport, protocol: _BufferedReaderProtocol
+    ) -> None:
+        self._transport = transport
+        self._protocol = protocol
+
+    async def write(self, data: bytes) -> None:
+        self._transport.write(data)
+        await self._protocol.drain()
+
+    async def write_many(self, chunks: Sequence[bytes]) -> None:
+        self._transport.writelines(chunks)
+        await self._protocol.drain()
+
+    async def close(self) -> None:
+        self._transport.close()
+        await self._protocol.wait_closed()
+
+
 @contextlib.asynccontextmanager
 async def _connect_async_bytes(
     socket_path: Path, buffer_size: Optional[int] = None
@@ -349,9 +608,9 @@ async def _connect_async_bytes(
         ...
     ```
 
-    The optional `buffer_size` argument determines the size of the input buffer
-    used by the returned reader instance. If not specified, a default value of
-    64kb will be used.
+    The optional `buffer_size` argument determines the size of the chunks in
+    which the returned reader instance receives data. If not specified, a
+    default value of 64kb will be used.
 
     Socket creation, connection, and closure will be automatically handled
     inside this context manager. If any of the socket operations fail, raise
@@ -359,12 +618,12 @@ async def _connect_async_bytes(
     """
     writer: Optional[AsyncBytesWriter] = None
     try:
-        limit = buffer_size if buffer_size is not None else 2**16
-        stream_reader, stream_writer = await asyncio.open_unix_connection(
-            str(socket_path), limit=limit
+        chunk_size = buffer_size if buffer_size is not None else 2**16
+        transport, protocol = await asyncio.get_running_loop().create_unix_connection(
+            lambda: _BufferedReaderProtocol(chunk_size), str(socket_path)
         )
-        reader = StreamBytesReader(stream_reader)
-        writer = StreamBytesWriter(stream_writer)
+        reader = ProtocolBytesReader(protocol)
+        writer = ProtocolBytesWriter(transport, protocol)
         yield reader, writer
     except OSError as error:
         raise ConnectionFailure() from error
@@ -408,16 +667,12 @@ async def create_async_stdin_stdout() -> Tuple[AsyncTextReader, AsyncTextWriter]
     not need to worry about whether the underlying async I/O channel comes from
     sockets or from stdin/stdout.
     """
-    loop = asyncio.get_event_loop()
-    stream_reader = asyncio.StreamReader(loop=loop)
-    await loop.connect_read_pipe(
-        lambda: asyncio.StreamReaderProtocol(stream_reader), sys.stdin
-    )
+    loop = asyncio.get_running_loop()
+    _, r_protocol = await loop.connect_read_pipe(_BufferedReaderProtocol, sys.stdin)
     w_transport, w_protocol = await loop.connect_write_pipe(
-        asyncio.streams.FlowControlMixin, sys.stdout
+        _BufferedReaderProtocol, sys.stdout
     )
-    stream_writer = asyncio.StreamWriter(w_transport, w_protocol, stream_reader, loop)
     return (
-        AsyncTextReader(StreamBytesReader(stream_reader)),
-        AsyncTextWriter(StreamBytesWriter(stream_writer)),
+        AsyncTextReader(ProtocolBytesReader(r_protocol)),
+        AsyncTextWriter(ProtocolBytesWriter(w_transport, w_protocol)),
     )
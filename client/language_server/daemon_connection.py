@@ -19,12 +19,14 @@ which is left to the higher layers.
 from __future__ import annotations
 
 import asyncio
+import atexit
 import contextlib
 import dataclasses
 import logging
+import threading
 import traceback
 from pathlib import Path
-from typing import AsyncIterator, Optional, Union
+from typing import AsyncIterator, BinaryIO, Dict, Optional, Tuple, Union
 
 from .. import dataclasses_json_extensions as json_mixins, log
 from . import connections
@@ -51,6 +53,105 @@ def send_raw_request(socket_path: Path, raw_request: str) -> str:
         return raw_response
 
 
+def _log_request_bytes(raw_request: bytes) -> None:
+    if LOG.isEnabledFor(logging.DEBUG):
+        LOG.debug(
+            f"Sending `{log.truncate(raw_request.decode(errors='replace'), 400)}`"
+        )
+
+
+def _log_response_bytes(raw_response: bytes) -> None:
+    if LOG.isEnabledFor(logging.DEBUG):
+        LOG.debug(
+            f"Received `{log.truncate(raw_response.decode(errors='replace'), 400)}`"
+        )
+
+
+class DaemonConnectionPool:
+    """
+    Keeps one open socket per daemon so that consecutive synchronous requests
+    do not each pay for a fresh `connect()`. The daemon processes requests on
+    a connection line by line, so a connection can be reused as long as every
+    request is followed by reading exactly one response line.
+
+    If a pooled connection turns out to be stale (e.g. the daemon restarted
+    since it was opened), it is dropped and the request is retried once on a
+    fresh connection. Callers that stop a daemon should `evict` its socket
+    path so that the connection is not kept open in the meantime.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._connections: Dict[
+            Path, Tuple[contextlib.ExitStack, BinaryIO, BinaryIO]
+        ] = {}
+
+    def _open(self, socket_path: Path) -> Tuple[BinaryIO, BinaryIO]:
+        with contextlib.ExitStack() as stack:
+            input_channel, output_channel = stack.enter_context(
+                connections.connect_bytes(socket_path)
+            )
+            self._connections[socket_path] = (
+                stack.pop_all(),
+                input_channel,
+                output_channel,
+            )
+            return input_channel, output_channel
+
+    def _discard(self, socket_path: Path) -> None:
+        entry = self._connections.pop(socket_path, None)
+        if entry is not None:
+            try:
+                entry[0].close()
+            except connections.ConnectionFailure:
+                pass
+
+    def send_raw_request_bytes(self, socket_path: Path, raw_request: bytes) -> bytes:
+        _log_request_bytes(raw_request)
+        with self._lock:
+            reused = socket_path in self._connections
+            while True:
+                entry = self._connections.get(socket_path)
+                if entry is not None:
+                    _, input_channel, output_channel = entry
+                else:
+                    input_channel, output_channel = self._open(socket_path)
+                try:
+                    output_channel.write(raw_request + b"\n")
+                    output_channel.flush()
+                    raw_response = input_channel.readline()
+                except OSError as error:
+                    self._discard(socket_path)
+                    if reused:
+                        reused = False
+                        continue
+                    raise connections.ConnectionFailure() from error
+                if not raw_response.endswith(b"\n"):
+                    # The daemon closed the connection before sending a full
+                    # response line: never keep such a connection around.
+                    self._discard(socket_path)
+                    if reused and len(raw_response) == 0:
+                        reused = False
+                        continue
+                break
+        raw_response = raw_response.strip()
+        _log_response_bytes(raw_response)
+        return raw_response
+
+    def evict(self, socket_path: Path) -> None:
+        with self._lock:
+            self._discard(socket_path)
+
+    def close(self) -> None:
+        with self._lock:
+            for socket_path in list(self._connections):
+                self._discard(socket_path)
+
+
+default_connection_pool: DaemonConnectionPool = DaemonConnectionPool()
+atexit.register(default_connection_pool.close)
+
+
 @dataclasses.dataclass(frozen=True)
 class AsyncConnection:
     reader: connections.AsyncTextReader
@@ -17,10 +17,14 @@ from __future__ import annotations
 
 import dataclasses
 import enum
+import types
 
-from typing import Dict
+from typing import Dict, Mapping
 
 
+# Members keep their string values since they are parsed from (and listed as)
+# command line choices. Enum members are singletons, so availability checks
+# compare by identity rather than going through `Enum.__eq__`.
 class _Availability(enum.Enum):
     ENABLED = "enabled"
     DISABLED = "disabled"
@@ -30,10 +34,10 @@ class _Availability(enum.Enum):
         return _Availability.ENABLED if enabled else _Availability.DISABLED
 
     def is_enabled(self) -> bool:
-        return self == _Availability.ENABLED
+        return self is _Availability.ENABLED
 
     def is_disabled(self) -> bool:
-        return self == _Availability.DISABLED
+        return self is _Availability.DISABLED
 
 
 class _AvailabilityWithShadow(enum.Enum):
@@ -50,13 +54,13 @@ class _AvailabilityWithShadow(enum.Enum):
         )
 
     def is_enabled(self) -> bool:
-        return self == _AvailabilityWithShadow.ENABLED
+        return self is _AvailabilityWithShadow.ENABLED
 
     def is_shadow(self) -> bool:
-        return self == _AvailabilityWithShadow.SHADOW
+        return self is _AvailabilityWithShadow.SHADOW
 
     def is_disabled(self) -> bool:
-        return self == _AvailabilityWithShadow.DISABLED
+        return self is _AvailabilityWithShadow.DISABLED
 
 
 class TypeCoverageAvailability(enum.Enum):
@@ -101,8 +105,21 @@ class LanguageServerFeatures:
     symbol: SymbolSearchAvailability = SymbolSearchAvailability.DISABLED
     inlay_hint: InlayHintAvailability = InlayHintAvailability.DISABLED
     formatting: FormattingAvailability = FormattingAvailability.DISABLED
+    _capabilities: Mapping[str, bool] = dataclasses.field(
+        init=False, repr=False, compare=False
+    )
+
+    def __post_init__(self) -> None:
+        # The dataclass is frozen, so the capabilities can never change after
+        # construction: compute them once here instead of on every request, and
+        # hand out a read-only view so that callers cannot mutate them.
+        object.__setattr__(
+            self,
+            "_capabilities",
+            types.MappingProxyType(self._compute_capabilities()),
+        )
 
-    def capabilities(self) -> Dict[str, bool]:
+    def _compute_capabilities(self) -> Dict[str, bool]:
         return {
             "hover_provider": not self.hover.is_disabled(),
             "definition_provider": not self.definition.is_disabled(),
@@ -115,3 +132,6 @@ class LanguageServerFeatures:
             "inlay_hint_provider": not self.inlay_hint.is_disabled(),
             "document_formatting_provider": not self.formatting.is_disabled(),
         }
+
+    def capabilities(self) -> Mapping[str, bool]:
+        return self._capabilities
@@ -133,9 +133,13 @@ async def read_json_rpc(
             continue
 
 
+def _json_rpc_header(payload: str) -> str:
+    return f"Content-Length: {len(payload)}\r\n\r\n"
+
+
 def json_rpc_payload(message: json_rpc.JSONRPC) -> str:
     payload = message.serialize()
-    return f"Content-Length: {len(payload)}\r\n\r\n{payload}"
+    return f"{_json_rpc_header(payload)}{payload}"
 
 
 async def write_json_rpc(
@@ -145,7 +149,8 @@ async def write_json_rpc(
     """
     Asynchronously write a JSON-RPC response to the given output channel.
     """
-    await output_channel.write(json_rpc_payload(response))
+    payload = response.serialize()
+    await output_channel.write_many([_json_rpc_header(payload), payload])
 
 
 async def write_json_rpc_ignore_connection_error(
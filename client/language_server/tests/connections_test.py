@@ -21,6 +21,12 @@ from ..connections import (
 )
 
 
+class PartialLineServerRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        self.wfile.write(b"abc\ndef")
+        self.wfile.flush()
+
+
 class EchoServerRequestHandler(socketserver.StreamRequestHandler):
     def handle(self) -> None:
         try:
@@ -68,6 +74,14 @@ class MemoryIOTest(testslide.TestCase):
         result = await reader.readline()
         self.assertEqual(result, b"")
 
+        reader = MemoryBytesReader(b"ab\r\ncd\r\n\r\n")
+        result = await reader.read_until(b"\r\n")
+        self.assertEqual(result, b"ab\r\n")
+        result = await reader.read_until(b"\r\n")
+        self.assertEqual(result, b"cd\r\n")
+        result = await reader.read_until(b"\r\n")
+        self.assertEqual(result, b"\r\n")
+
         try:
             await MemoryBytesReader(b"abc").read_until(b"d")
         except asyncio.IncompleteReadError as error:
@@ -84,7 +98,8 @@ class MemoryIOTest(testslide.TestCase):
         await writer.write(b"foo")
         await writer.write(b"bar")
         await writer.write(b"baz")
-        self.assertListEqual(writer.items(), [b"foo", b"bar", b"baz"])
+        await writer.write_many([b"foo", b"bar"])
+        self.assertListEqual(writer.items(), [b"foo", b"bar", b"baz", b"foobar"])
 
 
 class AsyncConnectionTest(testslide.TestCase):
@@ -122,6 +137,21 @@ class AsyncConnectionTest(testslide.TestCase):
                 result = await input_channel.read_until("\n")
                 self.assertEqual(message, result)
 
+    @setup.async_test
+    async def test_read_until_eof(self) -> None:
+        with setup.spawn_unix_stream_server(
+            PartialLineServerRequestHandler
+        ) as socket_path:
+            async with connect_async(socket_path, buffer_size=2) as (
+                input_channel,
+                _,
+            ):
+                result = await input_channel.read_until("\n")
+                self.assertEqual("abc\n", result)
+                with self.assertRaises(asyncio.IncompleteReadError) as context:
+                    await input_channel.read_until("\n")
+                self.assertEqual(b"def", context.exception.partial)
+
     async def test_text_errors(self) -> None:
         bytes_reader = MemoryBytesReader("∅\n".encode("utf-16"))
         text_reader = AsyncTextReader(bytes_reader, encoding="utf-8")
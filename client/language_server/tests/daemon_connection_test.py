@@ -6,6 +6,7 @@
 # pyre-strict
 
 import asyncio
+import socketserver
 from pathlib import Path
 from types import TracebackType
 from typing import AsyncContextManager, Optional, Type, TypeVar
@@ -15,7 +16,11 @@ import testslide
 from ...tests import setup
 
 from .. import connections
-from ..daemon_connection import attempt_send_async_raw_request, DaemonConnectionFailure
+from ..daemon_connection import (
+    attempt_send_async_raw_request,
+    DaemonConnectionFailure,
+    DaemonConnectionPool,
+)
 
 T = TypeVar("T")
 
@@ -127,3 +132,80 @@ class SendTest(testslide.TestCase):
         )
         result = await attempt_send_async_raw_request(Path("dummy"), "dummy_request")
         self.assertTrue(isinstance(result, DaemonConnectionFailure))
+
+
+class CountingEchoRequestHandler(socketserver.StreamRequestHandler):
+    connection_count: int = 0
+
+    def handle(self) -> None:
+        CountingEchoRequestHandler.connection_count += 1
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            self.wfile.write(line.upper())
+            self.wfile.flush()
+
+
+class SingleResponseRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        line = self.rfile.readline()
+        self.wfile.write(line.upper())
+        self.wfile.flush()
+
+
+class ConnectionPoolTest(testslide.TestCase):
+    def test_send_raw_request_bytes__reuses_connection(self) -> None:
+        CountingEchoRequestHandler.connection_count = 0
+        pool = DaemonConnectionPool()
+        with setup.spawn_unix_stream_server(CountingEchoRequestHandler) as socket_path:
+            try:
+                self.assertEqual(
+                    pool.send_raw_request_bytes(socket_path, b"foo"), b"FOO"
+                )
+                self.assertEqual(
+                    pool.send_raw_request_bytes(socket_path, b"bar"), b"BAR"
+                )
+            finally:
+                pool.close()
+        self.assertEqual(CountingEchoRequestHandler.connection_count, 1)
+
+    def test_evict(self) -> None:
+        CountingEchoRequestHandler.connection_count = 0
+        pool = DaemonConnectionPool()
+        with setup.spawn_unix_stream_server(CountingEchoRequestHandler) as socket_path:
+            try:
+                self.assertEqual(
+                    pool.send_raw_request_bytes(socket_path, b"foo"), b"FOO"
+                )
+                pool.evict(socket_path)
+                # Evicting a path without a pooled connection is a no-op.
+                pool.evict(socket_path)
+                self.assertEqual(
+                    pool.send_raw_request_bytes(socket_path, b"bar"), b"BAR"
+                )
+            finally:
+                pool.close()
+        self.assertEqual(CountingEchoRequestHandler.connection_count, 2)
+
+    def test_send_raw_request_bytes__reconnects(self) -> None:
+        pool = DaemonConnectionPool()
+        with setup.spawn_unix_stream_server(
+            SingleResponseRequestHandler
+        ) as socket_path:
+            try:
+                self.assertEqual(
+                    pool.send_raw_request_bytes(socket_path, b"foo"), b"FOO"
+                )
+                # The server has hung up on the pooled connection by now.
+                self.assertEqual(
+                    pool.send_raw_request_bytes(socket_path, b"bar"), b"BAR"
+                )
+            finally:
+                pool.close()
+
+    def test_send_raw_request_bytes__connection_failure(self) -> None:
+        with self.assertRaises(connections.ConnectionFailure):
+            DaemonConnectionPool().send_raw_request_bytes(
+                Path("/tmp/non_existent.sock"), b"foo"
+            )
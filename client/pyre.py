@@ -1451,6 +1451,15 @@ def report_any_expressions(
     default=False,
     help="Pretty print human-readable type coverage summary for project.",
 )
+@click.option(
+    "--use-cache",
+    is_flag=True,
+    default=False,
+    help=(
+        "Cache per-module results in the `.pyre` directory, so that re-runs only "
+        "parse modules that changed."
+    ),
+)
 @click.pass_context
 def statistics(
     context: click.Context,
@@ -1458,6 +1467,7 @@ def statistics(
     log_results: bool,
     aggregate: bool,
     print_summary: bool,
+    use_cache: bool,
 ) -> int:
     """
     Collect various syntactic metrics on type coverage.
@@ -1479,6 +1489,7 @@ def statistics(
             log_results=log_results,
             aggregate=aggregate,
             print_summary=print_summary,
+            use_cache=use_cache,
         ),
     )
 
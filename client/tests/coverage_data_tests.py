@@ -6,7 +6,7 @@
 import tempfile
 import textwrap
 from pathlib import Path
-from typing import Optional, Sequence
+from typing import List, Optional, Sequence
 
 import libcst as cst
 
@@ -50,6 +50,12 @@ class ParsingHelpersTest(testslide.TestCase):
             self.assertIsNotNone(module_from_path(source_path))
             self.assertIsNone(module_from_path(root_path / "nonexistent.py"))
 
+            latin_1_path = root_path / "latin_1.py"
+            latin_1_path.write_bytes(b"# -*- coding: latin-1 -*-\nx = '\xe9'\n")
+            module = module_from_path(latin_1_path)
+            self.assertIsNotNone(module)
+            self.assertIn("\u00e9", module.module.code)
+
     def test_module_from_code(self) -> None:
         self.assertIsNotNone(
             module_from_code(
@@ -71,6 +77,72 @@ class ParsingHelpersTest(testslide.TestCase):
             )
         )
 
+    def test_collect_all(self) -> None:
+        module = parse_code(
+            """
+            # pyre-strict
+            class A:
+                def foo(self, x) -> int:  # pyre-fixme[2]
+                    return x  # type: ignore
+            def bar(y: int):  # pyre-ignore
+                pass
+            """
+        )
+        path = Path("/a/b/c.py")
+        self.assertEqual(
+            coverage_data.collect_all(module, False, path),
+            (
+                coverage_data.collect_mode(module, False, path),
+                coverage_data.collect_functions(module),
+                coverage_data.collect_suppressions(module),
+            ),
+        )
+
+    def test_composite_visitor(self) -> None:
+        class NameVisitor(cst.CSTVisitor):
+            def __init__(self) -> None:
+                self.events: List[str] = []
+
+            def visit_Name(self, node: cst.Name) -> None:
+                self.events.append(f"visit {node.value}")
+
+            def leave_Name(self, original_node: cst.Name) -> None:
+                self.events.append(f"leave {original_node.value}")
+
+            def visit_FunctionDef_body(self, node: cst.FunctionDef) -> None:
+                self.events.append(f"body {node.name.value}")
+
+        class ClassVisitor(cst.CSTVisitor):
+            def __init__(self) -> None:
+                self.classes: List[str] = []
+
+            def visit_ClassDef(self, node: cst.ClassDef) -> None:
+                self.classes.append(node.name.value)
+
+        module = parse_code(
+            """
+            class A:
+                def foo(self) -> None: ...
+            """
+        )
+        expected_names = NameVisitor()
+        module.visit(expected_names)
+        names = NameVisitor()
+        classes = ClassVisitor()
+        composite = coverage_data.CompositeVisitor([names, classes])
+        module.visit(composite)
+
+        self.assertEqual(names.events, expected_names.events)
+        self.assertIn("body foo", names.events)
+        self.assertEqual(classes.classes, ["A"])
+        # Visitors are only dispatched to for the nodes they handle.
+        self.assertEqual(
+            composite._visit_functions[(cst.Name, None)], [names.visit_Name]
+        )
+        self.assertEqual(
+            composite._visit_functions[(cst.ClassDef, None)], [classes.visit_ClassDef]
+        )
+
 
 class AnnotationCollectorTest(testslide.TestCase):
     maxDiff = 2000
@@ -1224,6 +1296,48 @@ class ModuleFindingHelpersTest(testslide.TestCase):
                 ],
             )
 
+    def test_find_module_paths__symlinks(self) -> None:
+        with tempfile.TemporaryDirectory() as root:
+            root_path = Path(root)
+            setup.ensure_files_exist(root_path, ["a/s0.py", "b/s1.py"])
+            setup.ensure_directories_exists(root_path, ["c.py"])
+            (root_path / "a/link").symlink_to(root_path / "b")
+            (root_path / "a/s2.py").symlink_to(root_path / "b/s1.py")
+            self.assertCountEqual(
+                find_module_paths([root_path / "a"], excludes=[]),
+                [
+                    root_path / "a/s0.py",
+                    root_path / "a/s2.py",
+                ],
+            )
+            self.assertCountEqual(
+                find_module_paths([root_path], excludes=[]),
+                [
+                    root_path / "a/s0.py",
+                    root_path / "a/s2.py",
+                    root_path / "b/s1.py",
+                ],
+            )
+
+    def test_iter_module_paths(self) -> None:
+        with tempfile.TemporaryDirectory() as root:
+            root_path = Path(root)
+            setup.ensure_files_exist(root_path, ["s0.py", "a/s1.py", "a/b/s2.py"])
+            # Overlapping inputs must not produce the same module twice.
+            paths = [root_path / "a", root_path, root_path / "a/s1.py"]
+            module_paths = list(coverage_data.iter_module_paths(paths, excludes=[]))
+            self.assertCountEqual(
+                module_paths,
+                [
+                    root_path / "s0.py",
+                    root_path / "a/s1.py",
+                    root_path / "a/b/s2.py",
+                ],
+            )
+            self.assertEqual(
+                sorted(module_paths), find_module_paths(paths, excludes=[])
+            )
+
     def test_find_module_paths__with_exclude(self) -> None:
         with tempfile.TemporaryDirectory() as root:
             root_path = Path(root)
@@ -1257,6 +1371,49 @@ class ModuleFindingHelpersTest(testslide.TestCase):
                 ],
             )
 
+    def test_find_module_paths__with_multiple_excludes(self) -> None:
+        with tempfile.TemporaryDirectory() as root:
+            root_path = Path(root)
+            setup.ensure_files_exist(
+                root_path,
+                ["s0.py", "a/s1.py", "b/s2.py", "b/c/s3.py"],
+            )
+            self.assertCountEqual(
+                find_module_paths(
+                    [root_path],
+                    excludes=[r".*2\.py", r".*/c/.*"],
+                ),
+                [
+                    root_path / "s0.py",
+                    root_path / "a/s1.py",
+                ],
+            )
+            # A pattern with an inline flag cannot be part of an alternation,
+            # but is still applied on its own.
+            self.assertCountEqual(
+                find_module_paths(
+                    [root_path],
+                    excludes=[r"(?i).*2\.PY", r".*/c/.*"],
+                ),
+                [
+                    root_path / "s0.py",
+                    root_path / "a/s1.py",
+                ],
+            )
+            # An invalid pattern disables exclusion rather than failing.
+            self.assertCountEqual(
+                find_module_paths(
+                    [root_path],
+                    excludes=[r".*2\.py", r"("],
+                ),
+                [
+                    root_path / "s0.py",
+                    root_path / "a/s1.py",
+                    root_path / "b/s2.py",
+                    root_path / "b/c/s3.py",
+                ],
+            )
+
     def test_find_module_paths__with_duplicates(self) -> None:
         with tempfile.TemporaryDirectory() as root:
             root_path = Path(root)
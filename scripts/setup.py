@@ -15,14 +15,19 @@ of builds.
 
 
 import argparse
+import collections
+import hashlib
 import logging
 import os
+import platform
+import re
+import shutil
 import subprocess
 import sys
 from enum import Enum
 from pathlib import Path
 from subprocess import CalledProcessError
-from typing import Dict, List, Mapping, Optional, Tuple
+from typing import Deque, Dict, List, Mapping, Match, Optional, Pattern, Set, Tuple
 
 
 LOG: logging.Logger = logging.getLogger(__name__)
@@ -50,6 +55,31 @@ DEPENDENCIES = [
 ]
 
 
+# `opam env --shell=bash` normally single-quotes values, so they may contain
+# `;` or `=`, and an embedded single quote is spelled `'\''`. Double-quoted
+# and bare values are valid bash too and are accepted as well.
+_OPAM_ENVIRONMENT_VARIABLE_REGEX: Pattern[str] = re.compile(
+    r"^(?P<name>[A-Za-z_][A-Za-z0-9_]*)="
+    r"(?:'(?P<single_quoted>(?:[^']|'\\'')*)'"
+    r'|"(?P<double_quoted>(?:[^"\\]|\\.)*)"'
+    r"|(?P<bare>(?:[^\s;'\"\\]|\\.)*))"
+    r"(?:;|$)",
+    re.MULTILINE,
+)
+_DOUBLE_QUOTED_ESCAPE_REGEX: Pattern[str] = re.compile(r'\\([$`"\\\n])')
+_BARE_ESCAPE_REGEX: Pattern[str] = re.compile(r"\\(.)", re.DOTALL)
+
+
+def _opam_environment_variable_value(match: Match[str]) -> str:
+    single_quoted = match.group("single_quoted")
+    if single_quoted is not None:
+        return single_quoted.replace("'\\''", "'")
+    double_quoted = match.group("double_quoted")
+    if double_quoted is not None:
+        return _DOUBLE_QUOTED_ESCAPE_REGEX.sub(r"\1", double_quoted)
+    return _BARE_ESCAPE_REGEX.sub(r"\1", match.group("bare"))
+
+
 class OldOpam(Exception):
     pass
 
@@ -91,9 +121,9 @@ def detect_opam_version() -> Tuple[int, ...]:
 
     LOG.info(f"Found opam version {'.'.join(map(str, version))}")
 
-    if version[0] != 2:
+    if version[0] != 2 or version < (2, 1):
         LOG.error(
-            "Pyre only supports opam 2.0.0 and above, please update your "
+            "Pyre only supports opam 2.1.0 and above, please update your "
             + "opam version."
         )
         raise OldOpam
@@ -101,25 +131,40 @@ def detect_opam_version() -> Tuple[int, ...]:
     return version
 
 
+# Defaults for every opam invocation; anything already set in the caller's
+# environment takes precedence.
+_OPAM_DEFAULT_ENVIRONMENT_VARIABLES: Mapping[str, str] = {
+    "OPAMJOBS": str(os.cpu_count() or 1),
+    "OPAMROOTISOK": "1",
+    "OPAMSOLVERTIMEOUT": "60",
+}
+
+
+def _command_environment(
+    add_environment_variables: Optional[Mapping[str, str]],
+) -> Dict[str, str]:
+    return {
+        **_OPAM_DEFAULT_ENVIRONMENT_VARIABLES,
+        **os.environ,
+        **({} if add_environment_variables is None else add_environment_variables),
+    }
+
+
 def _run_command(
     command: List[str],
     current_working_directory: Optional[Path] = None,
     add_environment_variables: Optional[Mapping[str, str]] = None,
 ) -> str:
-    if add_environment_variables:
-        environment_variables = {
-            **os.environ,
-            **add_environment_variables,
-        }
-    else:
-        environment_variables = None
     LOG.info(command)
     try:
         output = subprocess.check_output(
             command,
             universal_newlines=True,
             cwd=current_working_directory,
-            env=environment_variables,
+            env=_command_environment(add_environment_variables),
+            # We only spawn well-known tools and hold no descriptors they could
+            # misuse; keeping them lets CPython use its faster spawn paths.
+            close_fds=False,
         )
     except CalledProcessError as called_process_error:
         LOG.info(
@@ -135,6 +180,44 @@ def _run_command(
         return output
 
 
+_STREAMED_OUTPUT_LINES_KEPT = 200
+
+
+def _run_command_streaming(
+    command: List[str],
+    current_working_directory: Optional[Path] = None,
+    add_environment_variables: Optional[Mapping[str, str]] = None,
+) -> None:
+    """
+    Like `_run_command`, but for commands whose output we do not need, such
+    as `opam install` and `make`. Output is consumed line by line and only
+    the tail is kept for the error message, so memory does not grow with the
+    length of the build log.
+    """
+    LOG.info(command)
+    output_tail: Deque[str] = collections.deque(maxlen=_STREAMED_OUTPUT_LINES_KEPT)
+    with subprocess.Popen(
+        command,
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+        cwd=current_working_directory,
+        env=_command_environment(add_environment_variables),
+        close_fds=False,
+    ) as process:
+        assert process.stdout is not None
+        for line in process.stdout:
+            line = line.rstrip("\n")
+            LOG.debug(line)
+            output_tail.append(line)
+    if process.returncode != 0:
+        output = "\n".join(output_tail)
+        LOG.info(
+            f"Command: {command} returned non zero exit code.\n"
+            f"stdout (last {_STREAMED_OUTPUT_LINES_KEPT} lines): {output}"
+        )
+        raise CalledProcessError(process.returncode, command, output=output)
+
+
 def _switch_name(release: bool) -> str:
     return f"{COMPILER_VERSION}+flambda" if release else COMPILER_VERSION
 
@@ -163,24 +246,39 @@ def _opam_command(opam_version: Tuple[int, ...]) -> List[str]:
     # We need to explicitly set the opam cli version we are using,
     # otherwise it automatically uses `2.0` which means we can't use
     # some options from 2.1 such as `--assume-depexts`.
-    if opam_version >= (2, 1):
-        command.append("--cli=2.1")
+    command.append("--cli=2.1")
 
     return command
 
 
+def _opam_jobs_arguments() -> List[str]:
+    # opam builds only a few packages at a time by default; the dependencies
+    # are independent enough to use every core.
+    return ["--jobs", str(os.cpu_count() or 1)]
+
+
 def produce_dune_file(pyre_directory: Path, build_type: BuildType) -> None:
+    source_directory = pyre_directory / "source"
     # lint-ignore: NoUnsafeFilesystemRule
-    with open(pyre_directory / "source" / "dune.in") as dune_in:
-        # lint-ignore: NoUnsafeFilesystemRule
-        with open(pyre_directory / "source" / "dune", "w") as dune:
-            dune_data = dune_in.read()
-            dune.write(
-                dune_data.replace("%VERSION%", build_type.value).replace(
-                    "%CUSTOM_LINKER_OPTION%",
-                    _custom_linker_option(pyre_directory, build_type),
-                )
-            )
+    dune_data = (
+        (source_directory / "dune.in")
+        .read_text()
+        .replace("%VERSION%", build_type.value)
+        .replace(
+            "%CUSTOM_LINKER_OPTION%",
+            _custom_linker_option(pyre_directory, build_type),
+        )
+    )
+    dune_path = source_directory / "dune"
+    # Leave an up-to-date file untouched so that dune does not see a new
+    # mtime and rebuild for nothing.
+    # lint-ignore: NoUnsafeFilesystemRule
+    if dune_path.exists() and dune_path.read_text() == dune_data:
+        return
+    temporary_dune_path = source_directory / "dune.tmp"
+    # lint-ignore: NoUnsafeFilesystemRule
+    temporary_dune_path.write_text(dune_data)
+    os.replace(temporary_dune_path, dune_path)
 
 
 def _opam_already_initialized(opam_root: Path) -> bool:
@@ -208,13 +306,12 @@ def _get_opam_environment_variables(
     opam_environment_variables: Dict[str, str] = {}
     # `opam env` produces lines of two forms:
     # - comments like ": this comment, starts with a colon;"
-    # - lines defining and exporting env vars like "ENV_VAR=value; export ENV_VAR;"
-    for line in opam_env_result.split("\n"):
-        if not line.startswith(":"):
-            environment_variable, quoted_value = line.split(";")[0].split("=")
-            value = quoted_value[1:-1]
-            LOG.info(f'{environment_variable}="{value}"')  # noqa: B907
-            opam_environment_variables[environment_variable] = value
+    # - lines defining and exporting env vars like "ENV_VAR='value'; export ENV_VAR;"
+    for match in _OPAM_ENVIRONMENT_VARIABLE_REGEX.finditer(opam_env_result):
+        environment_variable = match.group("name")
+        value = _opam_environment_variable_value(match)
+        LOG.debug(f'{environment_variable}="{value}"')  # noqa: B907
+        opam_environment_variables[environment_variable] = value
     return opam_environment_variables
 
 
@@ -255,8 +352,8 @@ def initialize_opam_switch(
         add_environment_variables=add_environment_variables,
     )
 
-    opam_update(opam_root, opam_version, add_environment_variables)
-
+    # `opam init` has just fetched the default repository, so there is no need
+    # for an `opam update` before creating the switch.
     _run_command(
         _opam_command(opam_version)
         + [
@@ -265,6 +362,7 @@ def initialize_opam_switch(
             _switch_name(release),
             _compiler_specification(release),
             "--yes",
+            *_opam_jobs_arguments(),
             "--root",
             opam_root.as_posix(),
         ],
@@ -274,15 +372,17 @@ def initialize_opam_switch(
         opam_root, opam_version, release
     )
 
-    opam_install_command = _opam_command(opam_version) + ["install", "--yes"]
+    opam_install_command = (
+        _opam_command(opam_version) + ["install", "--yes"] + _opam_jobs_arguments()
+    )
 
-    if sys.platform == "linux" and opam_version >= (2, 1):
+    if sys.platform == "linux":
         # setting `--assume-depexts` means that opam will not require a "system"
         # installed version of Rust (e.g. via `dnf`` or `yum`) but will instead
         # accept a version referenced on the system `$PATH`
         opam_install_command.append("--assume-depexts")
 
-    _run_command(
+    _run_command_streaming(
         opam_install_command + DEPENDENCIES,
         add_environment_variables={
             **({} if add_environment_variables is None else add_environment_variables),
@@ -293,6 +393,41 @@ def initialize_opam_switch(
     return opam_environment_variables
 
 
+def _installed_packages(
+    opam_root: Path,
+    opam_version: Tuple[int, ...],
+    release: bool,
+    add_environment_variables: Optional[Mapping[str, str]] = None,
+) -> Set[str]:
+    """
+    Return the packages installed in the switch, in the same `name.version`
+    form as `DEPENDENCIES`. Return an empty set if opam cannot tell.
+    """
+    try:
+        output = _run_command(
+            _opam_command(opam_version)
+            + [
+                "list",
+                "--installed",
+                "--short",
+                "--columns=name,version",
+                "--switch",
+                _switch_name(release),
+                "--root",
+                opam_root.as_posix(),
+            ],
+            add_environment_variables=add_environment_variables,
+        )
+    except CalledProcessError:
+        return set()
+    installed_packages = set()
+    for line in output.splitlines():
+        fields = line.split()
+        if len(fields) == 2:
+            installed_packages.add(f"{fields[0]}.{fields[1]}")
+    return installed_packages
+
+
 def set_opam_switch_and_install_dependencies(
     opam_root: Path,
     opam_version: Tuple[int, ...],
@@ -320,7 +455,17 @@ def set_opam_switch_and_install_dependencies(
             str(rust_path) + ":" + environment_variables["PATH"]
         )
 
-    opam_install_command = _opam_command(opam_version) + ["install", "--yes"]
+    # Even when there is nothing to do, `opam install` takes a while to find
+    # out; listing the installed packages is much faster.
+    if set(DEPENDENCIES).issubset(
+        _installed_packages(opam_root, opam_version, release, environment_variables)
+    ):
+        LOG.info("All dependencies are already installed")
+        return environment_variables
+
+    opam_install_command = (
+        _opam_command(opam_version) + ["install", "--yes"] + _opam_jobs_arguments()
+    )
 
     if sys.platform == "linux":
         # osx fails on sandcastle with exit status 2 (illegal argument) with this.
@@ -329,7 +474,9 @@ def set_opam_switch_and_install_dependencies(
 
     opam_install_command += DEPENDENCIES
 
-    _run_command(opam_install_command, add_environment_variables=environment_variables)
+    _run_command_streaming(
+        opam_install_command, add_environment_variables=environment_variables
+    )
     return environment_variables
 
 
@@ -356,7 +503,7 @@ def full_setup(
     )
 
     def run_in_opam_environment(command: List[str]) -> None:
-        _run_command(
+        _run_command_streaming(
             command,
             current_working_directory=pyre_directory / "source",
             add_environment_variables=opam_environment_variables,
@@ -368,7 +515,7 @@ def full_setup(
         # explicit `produce_dune_file` to remain.
         # Dune 3.7 runs into `rmdir` failure when cleaning the `_build` directory
         # for some reason. Manually clean the dir to work around the issue.
-        run_in_opam_environment(["rm", "-rf", "_build"])
+        shutil.rmtree(pyre_directory / "source" / "_build", ignore_errors=True)
     if release:
         LOG.info("Running a release build. This may take a while.")
         run_in_opam_environment(["make", "release"])
@@ -397,6 +544,90 @@ def _infer_build_type_from_filesystem(pyre_directory: Path) -> BuildType:
         return BuildType.EXTERNAL
 
 
+def _opam_root_cache_file(
+    cache_directory: Path, opam_root: Path, release: bool
+) -> Path:
+    """
+    The cached opam root only depends on what ends up installed in it, so it
+    is keyed on the compiler, the dependencies and the platform. The root
+    itself is part of the key because opam records absolute paths.
+    """
+    key = hashlib.sha256(
+        repr(
+            (
+                COMPILER_VERSION,
+                tuple(sorted(DEPENDENCIES)),
+                sys.platform,
+                platform.machine(),
+                release,
+                opam_root.as_posix(),
+            )
+        ).encode()
+    ).hexdigest()
+    extension = "zst" if shutil.which("zstd") is not None else "gz"
+    return cache_directory / f"opam-{key}.tar.{extension}"
+
+
+def _tar_compression_arguments(cache_file: Path) -> List[str]:
+    if cache_file.suffix == ".zst":
+        return ["--use-compress-program=zstd"]
+    return ["--gzip"]
+
+
+def restore_opam_root_from_cache(
+    cache_directory: Path, opam_root: Path, release: bool
+) -> bool:
+    cache_file = _opam_root_cache_file(cache_directory, opam_root, release)
+    if not cache_file.is_file():
+        LOG.info(f"No cached opam root at {cache_file}")
+        return False
+    LOG.info(f"Restoring opam root from {cache_file}")
+    opam_root.mkdir(parents=True, exist_ok=True)
+    try:
+        _run_command(
+            ["tar", "--extract", "--file", str(cache_file)]
+            + _tar_compression_arguments(cache_file)
+            + ["--directory", opam_root.as_posix()]
+        )
+    except CalledProcessError:
+        LOG.warning("Could not restore the cached opam root, initializing instead")
+        shutil.rmtree(opam_root, ignore_errors=True)
+        return False
+    return True
+
+
+def save_opam_root_to_cache(
+    cache_directory: Path, opam_root: Path, release: bool
+) -> None:
+    cache_file = _opam_root_cache_file(cache_directory, opam_root, release)
+    cache_directory.mkdir(parents=True, exist_ok=True)
+    # Write to a temporary file first so that an interrupted run never leaves a
+    # truncated archive behind under the final name.
+    temporary_file = cache_file.with_name(f"{cache_file.name}.tmp")
+    LOG.info(f"Caching opam root to {cache_file}")
+    try:
+        _run_command(
+            ["tar", "--create", "--file", str(temporary_file)]
+            + _tar_compression_arguments(cache_file)
+            # Build directories, sources and logs are not needed to use the
+            # installed packages.
+            + [
+                "--exclude=./download-cache",
+                "--exclude=./log",
+                "--exclude=./*/.opam-switch/build",
+                "--exclude=./*/.opam-switch/sources",
+                "--directory",
+                opam_root.as_posix(),
+                ".",
+            ]
+        )
+    except CalledProcessError:
+        LOG.warning("Could not cache the opam root")
+        temporary_file.unlink(missing_ok=True)
+        return
+    temporary_file.replace(cache_file)
+
+
 def setup(
     add_environment_variables: Optional[Mapping[str, str]] = None,
 ) -> None:
@@ -415,6 +646,12 @@ def setup(
     parser.add_argument("--build-type", type=BuildType)
     parser.add_argument("--no-tests", action="store_true")
     parser.add_argument("--rust-path", type=Path)
+    parser.add_argument(
+        "--opam-cache-directory",
+        type=Path,
+        help="Restore a freshly initialized opam root from (and save it to) "
+        + "an archive in this directory.",
+    )
 
     parsed = parser.parse_args()
 
@@ -430,10 +667,16 @@ def setup(
     if parsed.configure:
         produce_dune_file(pyre_directory, build_type)
     else:
+        opam_cache_directory = parsed.opam_cache_directory
         if not _opam_already_initialized(opam_root):
-            initialize_opam_switch(
-                opam_root, opam_version, release, add_environment_variables
-            )
+            if opam_cache_directory is None or not restore_opam_root_from_cache(
+                opam_cache_directory, opam_root, release
+            ):
+                initialize_opam_switch(
+                    opam_root, opam_version, release, add_environment_variables
+                )
+                if opam_cache_directory is not None:
+                    save_opam_root_to_cache(opam_cache_directory, opam_root, release)
         else:
             opam_update(opam_root, opam_version, add_environment_variables)
         full_setup(
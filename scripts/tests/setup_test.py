@@ -0,0 +1,62 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+# pyre-strict
+
+import unittest
+from pathlib import Path
+from typing import Dict
+from unittest import mock
+
+from .. import setup
+
+
+class OpamEnvironmentVariablesTest(unittest.TestCase):
+    def assert_parsed(self, opam_env_output: str, expected: Dict[str, str]) -> None:
+        with mock.patch.object(setup, "_run_command", return_value=opam_env_output):
+            self.assertEqual(
+                setup._get_opam_environment_variables(
+                    Path("/opam-root"), (2, 1, 0), release=False
+                ),
+                expected,
+            )
+
+    def test_single_quoted(self) -> None:
+        self.assert_parsed(
+            "OPAM_SWITCH_PREFIX='/root/default'; export OPAM_SWITCH_PREFIX;\n"
+            "XDG='a;b=c'; export XDG;\n"
+            "QUOTE='it'\\''s'; export QUOTE;",
+            {
+                "OPAM_SWITCH_PREFIX": "/root/default",
+                "XDG": "a;b=c",
+                "QUOTE": "it's",
+            },
+        )
+
+    def test_double_quoted(self) -> None:
+        self.assert_parsed(
+            'PATH="/root/default/bin:$PATH"; export PATH;\n'
+            'ESCAPED="say \\"hi\\" \\\\ \\$HOME"; export ESCAPED;',
+            {
+                "PATH": "/root/default/bin:$PATH",
+                "ESCAPED": 'say "hi" \\ $HOME',
+            },
+        )
+
+    def test_bare(self) -> None:
+        self.assert_parsed(
+            "OPAMNOENVNOTICE=true; export OPAMNOENVNOTICE;\n"
+            "EMPTY=; export EMPTY;\n"
+            "SPACED=a\\ b; export SPACED;",
+            {"OPAMNOENVNOTICE": "true", "EMPTY": "", "SPACED": "a b"},
+        )
+
+    def test_comments_are_skipped(self) -> None:
+        self.assert_parsed(
+            ": this comment, starts with a colon;\n"
+            "OPAM_SWITCH_PREFIX='/root/default'; export OPAM_SWITCH_PREFIX;",
+            {"OPAM_SWITCH_PREFIX": "/root/default"},
+        )
+
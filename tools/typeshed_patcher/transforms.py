@@ -11,7 +11,8 @@ stub patches to open-source typeshed stubs.
 """
 from __future__ import annotations
 
-from typing import Callable, Iterable, Sequence
+import functools
+from typing import Any, Callable, Iterable, Sequence
 
 import libcst
 import libcst.codemod
@@ -19,11 +20,15 @@ import libcst.codemod
 from . import patch_specs
 
 
+@functools.lru_cache(maxsize=1024)
 def statements_from_content(content: str) -> Sequence[libcst.BaseStatement]:
     """
     Given a content string (originating from a patch toml file),
     parse statements as a CST so that we can apply them in a
     libcst transform.
+
+    Patches often add the same content in many places, so parses are
+    cached; this is safe because CST nodes are immutable.
     """
     try:
         module = libcst.parse_module(content)
@@ -141,6 +146,83 @@ def import_names_match_name(
         return False
 
 
+def _simple_statement_line_matches_name(
+    name: str,
+    statement: libcst.SimpleStatementLine,
+) -> bool:
+    if len(statement.body) != 1:
+        raise ValueError(
+            f"Did not expect compound statement line {statement} "
+            "in a stub scope we patch."
+        )
+    return statement_matches_name(name, statement.body[0])
+
+
+def _assign_matches_name(
+    name: str,
+    statement: libcst.Assign,
+) -> bool:
+    # Regular assignment is unusual in stubs, but happens in type aliases.
+    if len(statement.targets) != 1:
+        raise ValueError(f"Expect only simple assignments in stubs, got {statement}")
+    target = statement.targets[0].target
+    if not isinstance(target, libcst.Name):
+        raise ValueError(f"Expect only simple assignments in stubs, got {statement}")
+    return target.value == name
+
+
+def _ann_assign_matches_name(
+    name: str,
+    statement: libcst.AnnAssign,
+) -> bool:
+    target = statement.target
+    if isinstance(target, libcst.Name):
+        return target.value == name
+    else:
+        raise ValueError(
+            "Did not expect non-name target {target} "
+            "of AnnAssign in a stub scope we patch."
+        )
+
+
+def _definition_matches_name(
+    name: str,
+    statement: libcst.FunctionDef | libcst.ClassDef,
+) -> bool:
+    return statement.name.value == name
+
+
+def _if_matches_name(
+    name: str,
+    statement: libcst.If,
+) -> bool:
+    return is_matching_if_block(
+        statement,
+        predicate=lambda s: statement_matches_name(name, s),
+    )
+
+
+def _import_matches_name(
+    name: str,
+    statement: libcst.Import | libcst.ImportFrom,
+) -> bool:
+    return import_names_match_name(statement.names, name)
+
+
+# LibCST node classes are not subclassed, so we can dispatch on the exact
+# type rather than walking through a chain of isinstance checks.
+_NAME_MATCHERS: dict[type[libcst.CSTNode], Callable[[str, Any], bool]] = {
+    libcst.SimpleStatementLine: _simple_statement_line_matches_name,
+    libcst.Assign: _assign_matches_name,
+    libcst.AnnAssign: _ann_assign_matches_name,
+    libcst.FunctionDef: _definition_matches_name,
+    libcst.ClassDef: _definition_matches_name,
+    libcst.If: _if_matches_name,
+    libcst.Import: _import_matches_name,
+    libcst.ImportFrom: _import_matches_name,
+}
+
+
 def statement_matches_name(
     name: str,
     statement: libcst.BaseStatement | libcst.BaseSmallStatement,
@@ -153,48 +235,10 @@ def statement_matches_name(
     are indented blocks consisting statements that themselves
     match the name.
     """
-    if isinstance(statement, libcst.SimpleStatementLine):
-        if len(statement.body) != 1:
-            raise ValueError(
-                f"Did not expect compound statement line {statement} "
-                "in a stub scope we patch."
-            )
-        return statement_matches_name(name, statement.body[0])
-    if isinstance(statement, libcst.Assign):
-        # Regular assignment is unusual in stubs, but happens in type aliases.
-        if len(statement.targets) != 1:
-            raise ValueError(
-                f"Expect only simple assignments in stubs, got {statement}"
-            )
-        target = statement.targets[0].target
-        if not isinstance(target, libcst.Name):
-            raise ValueError(
-                f"Expect only simple assignments in stubs, got {statement}"
-            )
-        return target.value == name
-    if isinstance(statement, libcst.AnnAssign):
-        target = statement.target
-        if isinstance(target, libcst.Name):
-            return target.value == name
-        else:
-            raise ValueError(
-                "Did not expect non-name target {target} "
-                "of AnnAssign in a stub scope we patch."
-            )
-    if isinstance(statement, libcst.FunctionDef):
-        return statement.name.value == name
-    if isinstance(statement, libcst.ClassDef):
-        return statement.name.value == name
-    if isinstance(statement, libcst.If):
-        return is_matching_if_block(
-            statement,
-            predicate=lambda s: statement_matches_name(name, s),
-        )
-    if isinstance(statement, libcst.Import):
-        return import_names_match_name(statement.names, name)
-    if isinstance(statement, libcst.ImportFrom):
-        return import_names_match_name(statement.names, name)
-    return False
+    matcher = _NAME_MATCHERS.get(type(statement))
+    if matcher is None:
+        return False
+    return matcher(name, statement)
 
 
 def is_import_statement(
@@ -358,7 +402,12 @@ class PatchTransform(libcst.codemod.ContextAwareTransformer):
 
     actions_by_parent: dict[str, list[patch_specs.Action]]
     processed_parents: set[str]
+    # Every class name that is a patch parent or encloses one; there is no
+    # need to descend into any other class.
+    parent_scopes: set[str]
 
+    # Fully qualified name of each enclosing class, innermost last,
+    # on top of the global scope "".
     current_names: list[str]
 
     def __init__(
@@ -367,8 +416,13 @@ class PatchTransform(libcst.codemod.ContextAwareTransformer):
     ) -> None:
         super().__init__(libcst.codemod.CodemodContext())
         self.actions_by_parent = actions_by_parent
+        self.parent_scopes = set()
+        for parent in actions_by_parent:
+            components = parent.split(".")
+            for index in range(1, len(components) + 1):
+                self.parent_scopes.add(".".join(components[:index]))
         # State to track current scope name and find the parent
-        self.current_names = []
+        self.current_names = [""]
         self.processed_parents = set()
 
     @staticmethod
@@ -384,18 +438,23 @@ class PatchTransform(libcst.codemod.ContextAwareTransformer):
         return PatchTransform(actions_by_parent=actions_by_parent)
 
     def get_current_name(self) -> str:
-        return ".".join(self.current_names)
+        return self.current_names[-1]
 
     def pop_current_name(self) -> str:
-        this_name = self.get_current_name()
-        self.current_names.pop()
-        return this_name
+        return self.current_names.pop()
 
     def visit_ClassDef(
         self,
         node: libcst.ClassDef,
-    ) -> None:
-        self.current_names.append(node.name.value)
+    ) -> bool:
+        enclosing_name = self.current_names[-1]
+        current_name = (
+            f"{enclosing_name}.{node.name.value}" if enclosing_name else node.name.value
+        )
+        # LibCST still calls `leave_ClassDef` for a skipped class, so we
+        # always push to keep the stack balanced.
+        self.current_names.append(current_name)
+        return current_name in self.parent_scopes
 
     def transform_parent_class(
         self,
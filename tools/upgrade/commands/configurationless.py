@@ -6,15 +6,18 @@
 # pyre-strict
 
 import argparse
+import fnmatch
+import itertools
 import json
 import logging
+import os
 import re
 import subprocess
 import tempfile
 from dataclasses import dataclass
-from functools import cached_property
+from functools import cached_property, lru_cache
 from pathlib import Path
-from typing import Collection, List, Optional, Set
+from typing import Collection, FrozenSet, List, Optional, Set
 
 from .. import filesystem
 from ..configuration import Configuration
@@ -43,6 +46,54 @@ class ConfigurationlessOptions:
             | self.local_configuration.get_exclude_as_patterns()
         )
 
+    @cached_property
+    def combined_exclude_pattern(self) -> Optional[re.Pattern[str]]:
+        """
+        A single alternation of all exclude patterns, so that each file is
+        searched once rather than once per pattern. Returns None if there are
+        no patterns, or if they cannot be combined (numbered backreferences
+        would shift, and global inline flags must come first), in which case
+        callers should fall back to `exclude_patterns`.
+        """
+        if len(self.exclude_patterns) == 0 or any(
+            re.search(r"\\\d", exclude_pattern.pattern) is not None
+            for exclude_pattern in self.exclude_patterns
+        ):
+            return None
+        try:
+            return re.compile(
+                "|".join(
+                    f"(?:{exclude_pattern.pattern})"
+                    for exclude_pattern in self.exclude_patterns
+                )
+            )
+        except re.error:
+            return None
+
+    def is_excluded(self, path: str) -> bool:
+        combined_exclude_pattern = self.combined_exclude_pattern
+        if combined_exclude_pattern is not None:
+            return combined_exclude_pattern.search(path) is not None
+        return any(
+            exclude_pattern.search(path) is not None
+            for exclude_pattern in self.exclude_patterns
+        )
+
+    @cached_property
+    def _ignore_all_errors_prefix_set(self) -> FrozenSet[Path]:
+        return frozenset(self.ignore_all_errors_prefixes)
+
+    def is_ignored(self, path: Path) -> bool:
+        """
+        Whether the (resolved) path is under an ignore-all-errors prefix. We
+        look up each of the path's ancestors, which is linear in the depth of
+        the path rather than in the number of prefixes.
+        """
+        prefixes = self._ignore_all_errors_prefix_set
+        if len(prefixes) == 0:
+            return False
+        return path in prefixes or any(parent in prefixes for parent in path.parents)
+
     @cached_property
     def default_global_mode(self) -> filesystem.LocalMode:
         global_is_strict = (
@@ -80,6 +131,28 @@ class ConfigurationlessOptions:
         )
 
 
+@lru_cache(maxsize=32)
+def _get_buck_root_for_path(path: Path) -> Path:
+    """
+    The project root is a property of the checkout, so it is only queried
+    once per directory.
+    """
+    try:
+        root = Path(
+            subprocess.check_output(
+                ["buck2", "root", "--kind", "project"],
+                text=True,
+                cwd=path,
+            ).strip()
+        )
+        LOG.info(f"buck2 root is {str(root)}")
+    except FileNotFoundError as e:
+        raise ValueError(
+            "Could not find `buck2` executable when `targets` were specified in local configuration."
+        ) from e
+    return root
+
+
 class Configurationless(Command):
     def __init__(
         self, *, repository: Repository, path: Path, includes: List[str], commit: bool
@@ -88,6 +161,19 @@ class Configurationless(Command):
         self._path: Path = path
         self._includes: List[str] = includes
         self._commit: bool = commit
+        # `PurePath.match` only looks at the file name for patterns without a
+        # separator, so those can be combined into one precompiled regex.
+        name_patterns = [pattern for pattern in includes if "/" not in pattern]
+        self._include_name_regex: Optional[re.Pattern[str]] = (
+            re.compile(
+                "|".join(fnmatch.translate(pattern) for pattern in name_patterns)
+            )
+            if len(name_patterns) > 0
+            else None
+        )
+        self._include_path_patterns: List[str] = [
+            pattern for pattern in includes if "/" in pattern
+        ]
 
     @staticmethod
     def from_arguments(
@@ -128,34 +214,24 @@ class Configurationless(Command):
     ) -> Optional[filesystem.LocalMode]:
         file = file.resolve()
         default_local_mode = options.default_local_mode
-        if any(
-            exclude_pattern.search(str(file)) is not None
-            for exclude_pattern in options.exclude_patterns
-        ):
+        if options.is_excluded(str(file)):
             return None
-        elif any(
-            file.is_relative_to(ignore_prefix)
-            for ignore_prefix in options.ignore_all_errors_prefixes
-        ):
+        elif options.is_ignored(file):
             return filesystem.LocalMode.IGNORE
         else:
             return default_local_mode
 
+    def _is_included(self, file: Path) -> bool:
+        include_name_regex = self._include_name_regex
+        if (
+            include_name_regex is not None
+            and include_name_regex.match(file.name) is not None
+        ):
+            return True
+        return any(file.match(pattern) for pattern in self._include_path_patterns)
+
     def _get_buck_root(self) -> Path:
-        try:
-            root = Path(
-                subprocess.check_output(
-                    ["buck2", "root", "--kind", "project"],
-                    text=True,
-                    cwd=self._path,
-                ).strip()
-            )
-            LOG.info(f"buck2 root is {str(root)}")
-        except FileNotFoundError as e:
-            raise ValueError(
-                "Could not find `buck2` executable when `targets` were specified in local configuration."
-            ) from e
-        return root
+        return _get_buck_root_for_path(self._path)
 
     @staticmethod
     def format_buck_targets_for_query(targets: Collection[str]) -> List[str]:
@@ -212,15 +288,32 @@ class Configurationless(Command):
                 f"Finding files from wildcard target expression with buck2 command: `{buck_command}`"
             )
 
-            result = subprocess.check_output(
+            # The query can return a very large number of files; build the set
+            # line by line instead of buffering the whole output in one string.
+            # The raw lines are only kept for the debug log and the error.
+            files: Set[Path] = set()
+            lines: List[str] = []
+            with subprocess.Popen(
                 buck_command,
+                stdout=subprocess.PIPE,
                 text=True,
                 cwd=self._path,
-            ).strip()
-
-            LOG.debug(f"Found files:\n`{result}`")
-
-            return {(buck_root / file.strip()).resolve() for file in result.split("\n")}
+            ) as process:
+                assert process.stdout is not None
+                for line in process.stdout:
+                    line = line.strip()
+                    if line:
+                        lines.append(line)
+                        files.add((buck_root / line).resolve())
+            if process.returncode != 0:
+                raise subprocess.CalledProcessError(
+                    process.returncode, buck_command, output="\n".join(lines)
+                )
+
+            if LOG.isEnabledFor(logging.DEBUG):
+                LOG.debug("Found files:\n`{}`".format("\n".join(lines)))
+
+            return files
 
     def _get_files_from_wildcard_targets(
         self, wildcard_targets: Collection[str], buck_project_root: Path
@@ -286,11 +379,19 @@ class Configurationless(Command):
             }
             build_map |= dropped_target_paths
 
-        return {
-            file
-            for file in build_map
-            if file.exists() and file.is_relative_to(self._path)
-        }
+        # Compare strings rather than calling `is_relative_to` (both are purely
+        # lexical), and check the prefix first so that we only stat files that
+        # are actually inside the project.
+        project_path = str(self._path)
+        project_prefix = os.path.join(project_path, "")
+        files = set()
+        for file in build_map:
+            file_path = str(file)
+            if (
+                file_path == project_path or file_path.startswith(project_prefix)
+            ) and file.exists():
+                files.add(file)
+        return files
 
     def _get_files_from_classic_targets(
         self, classic_targets: Collection[str], buck_project_root: Path
@@ -334,8 +435,8 @@ class Configurationless(Command):
 
         return {
             file
-            for file in wildcard_target_files | classic_target_files
-            if any(file.match(pattern) for pattern in self._includes)
+            for file in itertools.chain(wildcard_target_files, classic_target_files)
+            if self._is_included(file)
         }
 
     def _get_files_to_migrate_from_source_directories(
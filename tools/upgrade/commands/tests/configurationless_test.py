@@ -5,6 +5,8 @@
 
 # pyre-strict
 
+import json
+import tempfile
 from pathlib import Path
 from typing import Any, Iterable, List, Optional
 from unittest import mock, TestCase
@@ -191,6 +193,25 @@ class TestConfigurationless(TestCase):
             )
         )
 
+    def test_get_mode_to_apply_file_in_any_exclude(self) -> None:
+        options = self.get_options(
+            exclude_patterns=[r".*/first/.*", r".*/second/.*", r"(?i).*/third/.*"],
+        )
+        for path in [
+            "path/to/first/file.py",
+            "path/to/second/file.py",
+            "path/to/THIRD/file.py",
+        ]:
+            self.assertIsNone(
+                self.configurationless.get_file_mode_to_apply(Path(path), options)
+            )
+        self.assertEqual(
+            self.configurationless.get_file_mode_to_apply(
+                Path("path/to/fourth/file.py"), options
+            ),
+            LocalMode.STRICT,
+        )
+
     def test_get_mode_to_apply_file_in_ignore(self) -> None:
         options = self.get_options(
             ignore_all_errors_prefixes=["path/to/ignore"],
@@ -204,6 +225,25 @@ class TestConfigurationless(TestCase):
             LocalMode.IGNORE,
         )
 
+    def test_get_mode_to_apply_file_in_nested_ignore(self) -> None:
+        options = self.get_options(
+            ignore_all_errors_prefixes=["path/to/ignore", "path/to/other"],
+        )
+        self.assertEqual(
+            self.configurationless.get_file_mode_to_apply(
+                Path("path/to/ignore/deeply/nested/file.py"),
+                options,
+            ),
+            LocalMode.IGNORE,
+        )
+        self.assertEqual(
+            self.configurationless.get_file_mode_to_apply(
+                Path("path/to/ignored/file.py"),
+                options,
+            ),
+            LocalMode.STRICT,
+        )
+
     def test_get_file_mode_to_apply_file_in_ignore_root_path(self) -> None:
         options = self.get_options(ignore_all_errors_prefixes=["//path/to/ignore"])
         with mock.patch.object(
@@ -280,3 +320,51 @@ class TestConfigurationless(TestCase):
             ),
             LocalMode.STRICT,
         )
+
+    def test_is_included(self) -> None:
+        configurationless = Configurationless(
+            repository=Repository(),
+            path=Path("."),
+            includes=["**.py", "*.pyi", "scripts/*.txt"],
+            commit=False,
+        )
+        self.assertTrue(configurationless._is_included(Path("/a/b/c.py")))
+        self.assertTrue(configurationless._is_included(Path("/a/b/c.pyi")))
+        self.assertTrue(configurationless._is_included(Path("/a/scripts/c.txt")))
+        self.assertFalse(configurationless._is_included(Path("/a/b/c.txt")))
+        self.assertFalse(configurationless._is_included(Path("/a/b.py/c")))
+
+    def test_get_files_from_sourcedb(self) -> None:
+        with tempfile.TemporaryDirectory() as root:
+            buck_root = Path(root).resolve()
+            project = buck_root / "project"
+            (project / "sub").mkdir(parents=True)
+            (project / "sub" / "a.py").touch()
+            (project / "b.py").touch()
+            (buck_root / "project_other").mkdir()
+            (buck_root / "project_other" / "c.py").touch()
+            sourcedb_path = buck_root / "db.json"
+            sourcedb_path.write_text(
+                json.dumps(
+                    {
+                        "build_map": {
+                            "sub/a.py": "project/sub/a.py",
+                            "c.py": "project_other/c.py",
+                            "missing.py": "project/missing.py",
+                        },
+                        "dropped_targets": {
+                            "//project:b": {"dropped_source_path": "project/b.py"},
+                        },
+                    }
+                )
+            )
+            configurationless = Configurationless(
+                repository=Repository(),
+                path=project,
+                includes=["**.py"],
+                commit=False,
+            )
+            self.assertEqual(
+                configurationless._get_files_from_sourcedb(sourcedb_path, buck_root),
+                {project / "sub" / "a.py", project / "b.py"},
+            )
@@ -12,6 +12,7 @@ The pyre-upgrade command is composed of many subcommands related to upgrading a
 
 import argparse
 import enum
+import functools
 import logging
 import sys
 import traceback
@@ -49,7 +50,12 @@ class ExitCode(enum.IntEnum):
     FAILURE = 2
 
 
-def run(repository: Repository) -> None:
+@functools.lru_cache(1)
+def _build_parser() -> argparse.ArgumentParser:
+    """
+    The parser does not depend on the invocation, so it is built once per
+    process and reused by subsequent calls to `run`.
+    """
     parser = argparse.ArgumentParser(fromfile_prefix_chars="@")
     parser.add_argument("--verbose", action="store_true", help="Enable verbose logging")
 
@@ -128,6 +134,12 @@ def run(repository: Repository) -> None:
     support_sqlalchemy = commands.add_parser("support-sqlalchemy")
     SupportSqlalchemy.add_arguments(support_sqlalchemy)
 
+    return parser
+
+
+def run(repository: Repository) -> None:
+    parser = _build_parser()
+
     # Initialize default values.
     arguments = parser.parse_args()
     # All commands should have the argument `command` set to their `from_arguments``